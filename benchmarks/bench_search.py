@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Per-keystroke cost of the selector's fuzzy filter.
+
+    python benchmarks/bench_search.py [hosts]
+
+Types a few queries one char at a time (plus a backspace) against a
+synthetic inventory and reports the time each keystroke takes.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ssh_connect.host import Host  # noqa: E402
+from ssh_connect.search import FuzzyFilter  # noqa: E402
+
+QUERIES = ["web", "db0", "prod12", "10.4", "xq", "admin"]
+BUDGET_MS = 5.0
+
+
+def synthetic_hosts(count, seed=1):
+    rnd = random.Random(seed)
+    roles = ["web", "db", "cache", "proxy", "build", "mail", "vpn", "k8s-node"]
+    envs = ["prod", "stage", "dev", "lab"]
+    hosts = []
+    for n in range(count):
+        name = f"{rnd.choice(roles)}{n % 100:02d}-{rnd.choice(envs)}{n // 100}"
+        ip = f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}"
+        host = Host(f"{name}.example.com", user=rnd.choice(["root", "admin", "deploy"]))
+        host.set_resolved(name.capitalize(), ip)
+        hosts.append(host)
+    return hosts
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    hosts = synthetic_hosts(count)
+
+    t0 = time.perf_counter()
+    search = FuzzyFilter(hosts)
+    print(f"index build: {(time.perf_counter() - t0) * 1000:.2f} ms for {count} hosts")
+
+    timings = []
+    for query in QUERIES:
+        search.set_query("")
+        for n in range(1, len(query) + 1):
+            t0 = time.perf_counter()
+            search.set_query(query[:n])
+            matches = search.matches
+            timings.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        search.set_query(query[:-1])
+        timings.append(time.perf_counter() - t0)
+        print(f"  {query!r:<10} {len(matches):>6} matches")
+
+    timings_ms = sorted(t * 1000 for t in timings)
+    worst = timings_ms[-1]
+    mean = sum(timings_ms) / len(timings_ms)
+    print(f"keystroke: mean {mean:.3f} ms, max {worst:.3f} ms ({len(timings_ms)} keystrokes)")
+
+    if worst > BUDGET_MS:
+        print(f"FAIL: slowest keystroke above {BUDGET_MS} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
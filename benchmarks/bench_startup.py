@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the non-interactive commands.
+
+    python benchmarks/bench_startup.py
+
+Runs each scripted subcommand under `python -X importtime` in a throwaway
+HOME with a small config, and fails if a command imports prompt_toolkit,
+imports PyYAML although the config snapshot is warm, or exceeds its import budget.
+Subprocesses (ssh, the editor) are replaced by no-ops, so nothing connects.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time of ssh_connect and everything it pulls in (ms)
+BUDGET_MS = 150
+
+CONFIG = """\
+settings:
+  resolve_dns: false
+hosts:
+  - host: 127.0.0.1
+    name: Local
+"""
+
+# argv, modules that must not be imported
+COMMANDS = [
+    (["--themes"], ["prompt_toolkit", "yaml"]),
+    (["--edit"], ["prompt_toolkit", "yaml"]),
+    (["--mux", "list"], ["prompt_toolkit", "yaml"]),
+    (["--list"], ["prompt_toolkit", "yaml"]),  # served from the snapshot
+    (["1"], ["prompt_toolkit", "yaml"]),
+]
+
+RUNNER = """\
+import runpy, subprocess, sys, os
+class Done:
+    returncode = 0
+    stderr = ""
+subprocess.run = lambda *a, **k: Done()
+os.execvp = lambda *a: None
+sys.argv = ["ssh_connect"] + sys.argv[1:]
+runpy.run_module("ssh_connect", run_name="__main__")
+print("MODULES", " ".join(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def run(argv, home, config):
+    env = dict(os.environ, HOME=home, SSH_CONNECT_HOSTS_FILE=config,
+               EDITOR="true", PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUNNER, *argv],
+        env=env, capture_output=True, text=True,
+    )
+    wall = (time.perf_counter() - start) * 1000
+
+    modules, total_us = set(), 0
+    for line in proc.stderr.splitlines():
+        if line.startswith("MODULES "):
+            modules = set(line.split()[1:])
+        elif line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            # Top-level ssh_connect imports (no nesting indent) carry
+            # everything imported below them
+            if name.startswith(" ssh_connect"):
+                total_us += int(cumulative)
+    return proc.returncode, modules, total_us / 1000, wall
+
+
+def main():
+    failures = 0
+    with tempfile.TemporaryDirectory() as home:
+        config = os.path.join(home, "hosts.yml")
+        with open(config, "w") as f:
+            f.write(CONFIG)
+        run(["--list"], home, config)  # warm the config snapshot
+
+        for argv, forbidden in COMMANDS:
+            code, modules, imports_ms, wall = run(argv, home, config)
+            leaked = [m for m in forbidden if m in modules]
+            ok = code == 0 and not leaked and imports_ms <= BUDGET_MS
+            failures += not ok
+            note = f" imported {', '.join(leaked)}" if leaked else ""
+            print(f"{' '.join(argv):<12} imports {imports_ms:7.1f} ms  "
+                  f"wall {wall:7.1f} ms  {'ok' if ok else 'FAIL'}{note}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
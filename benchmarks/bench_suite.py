@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+End-to-end timings on synthetic inventories, compared against a baseline.
+
+    python benchmarks/bench_suite.py                      # 100 .. 50k hosts
+    python benchmarks/bench_suite.py --sizes 1000,10000
+    python benchmarks/bench_suite.py --save               # store the baseline
+    python benchmarks/bench_suite.py --latency 20 --fail-rate 0.2
+
+For each size a config with a mix of IPv4 addresses, FQDNs and short names
+is written to a throwaway HOME, then measured:
+
+  load_cold    load_config() parsing the YAML (no snapshot yet)
+  load_warm    load_config() again, served from the snapshot
+  resolve      _resolve_hosts() against a fake resolver (no DNS cache)
+  sort         Sorter("ip").sort() of the resolved hosts
+  first_frame  select_host() until its first frame is rendered
+  key_mean/p95/max
+               typing a query and backspacing it, from each key to the
+               frame showing it (selector driven through a pipe input)
+
+The fake resolver answers every name deterministically after `--latency`
+ms and fails `--fail-rate` of them, so runs are comparable across machines'
+networks. With a baseline (default benchmarks/baseline.json, written by
+--save) a metric more than --tolerance times slower than before (and at
+least 1 ms) fails the run.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from prompt_toolkit import Application  # noqa: E402
+from prompt_toolkit.application import create_app_session  # noqa: E402
+from prompt_toolkit.input import create_pipe_input  # noqa: E402
+from prompt_toolkit.output import DummyOutput  # noqa: E402
+
+import ssh_connect.ui.selector as selector  # noqa: E402
+from ssh_connect import resolver  # noqa: E402
+from ssh_connect.config import load_config, _resolve_hosts  # noqa: E402
+from ssh_connect.sorting import Sorter  # noqa: E402
+
+SIZES = [100, 1000, 10000, 50000]
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+QUERY = "web1-prod"
+# Differences below this are noise, whatever the ratio
+MIN_REGRESSION_MS = 1.0
+
+
+def synthetic_config(count, seed=1):
+    rnd = random.Random(seed)
+    roles = ["web", "db", "cache", "proxy", "build", "mail", "vpn", "k8s-node"]
+    envs = ["prod", "stage", "dev", "lab"]
+    lines = ["settings:", "  resolve_dns: true", "  dns_cache: false", "hosts:"]
+    for n in range(count):
+        short = f"{rnd.choice(roles)}{n % 100}-{rnd.choice(envs)}{n // 100}"
+        kind = n % 3
+        if kind == 0:
+            lines.append(f"  - host: 10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}")
+        elif kind == 1:
+            lines.append(f"  - host: {short}.example.com")
+        else:
+            lines.append(f"  - host: {short}")
+        lines.append(f"    user: {rnd.choice(['root', 'admin', 'deploy'])}")
+        if n % 7 == 0:
+            lines.append(f"    name: {short.capitalize()}")
+    return "\n".join(lines) + "\n"
+
+
+def fake_resolver(latency, fail_rate):
+    """Lookups that take `latency` s and fail for a fixed share of names."""
+    def outcome(name):
+        h = zlib.crc32(name.encode())
+        if (h % 10000) / 10000 < fail_rate:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return h
+
+    def forward(name):
+        time.sleep(latency)
+        h = outcome(name)
+        return f"10.{h >> 16 & 255}.{h >> 8 & 255}.{h & 255 or 1}"
+
+    def reverse(ip):
+        time.sleep(latency)
+        return f"host-{outcome(ip) & 0xffff}.example.net"
+
+    return {"forward": forward, "reverse": reverse}
+
+
+def timed(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def drive_selector(hosts):
+    """(first frame ms, [ms per keystroke]) of a headless select_host()."""
+    rendered = threading.Event()
+    frames = []
+
+    class TimedApplication(Application):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.after_render += lambda app: (frames.append(time.perf_counter()), rendered.set())
+
+    keystrokes = []
+
+    def feed(inp):
+        rendered.wait(30)
+        time.sleep(0.05)  # let the start-up renders settle
+        keys = list(QUERY) + ["\x7f"] * len(QUERY)
+        for key in keys:
+            rendered.clear()
+            t0 = time.perf_counter()
+            inp.send_text(key)
+            if not rendered.wait(10):
+                break
+            keystrokes.append((time.perf_counter() - t0) * 1000)
+        inp.send_text("\x03")  # Ctrl-C
+
+    selector.Application = TimedApplication
+    try:
+        with create_pipe_input() as inp, create_app_session(input=inp, output=DummyOutput()):
+            threading.Thread(target=feed, args=(inp,), daemon=True).start()
+            started = time.perf_counter()
+            selector.select_host(hosts, None, style=None)
+    finally:
+        selector.Application = Application
+    return (frames[0] - started) * 1000, keystrokes
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run_size(count, home):
+    path = os.path.join(home, f"hosts-{count}.yml")
+    with open(path, "w") as f:
+        f.write(synthetic_config(count))
+
+    metrics = {}
+    (settings, hosts), metrics["load_cold"] = timed(load_config, path, resolve=False)
+    _, metrics["load_warm"] = timed(load_config, path, resolve=False)
+    _, metrics["resolve"] = timed(_resolve_hosts, hosts, settings)
+    _, metrics["sort"] = timed(Sorter("ip").sort, hosts)
+
+    first_frame, keys = drive_selector(hosts)
+    metrics["first_frame"] = first_frame
+    metrics["key_mean"] = sum(keys) / len(keys) if keys else 0.0
+    metrics["key_p95"] = percentile(keys, 0.95)
+    metrics["key_max"] = max(keys, default=0.0)
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing regressions against `baseline`."""
+    regressions = []
+    for size, metrics in results.items():
+        before = baseline.get(size, {})
+        for name, value in metrics.items():
+            old = before.get(name)
+            if old is not None and value > old * tolerance and value - old >= MIN_REGRESSION_MS:
+                regressions.append(f"  {size:>6} hosts  {name:<12} {old:9.2f} -> {value:9.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma-separated host counts")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake DNS latency in ms")
+    parser.add_argument("--fail-rate", type=float, default=0.05,
+                        help="share of names the fake resolver fails")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="slowdown factor that counts as a regression")
+    args = parser.parse_args()
+
+    resolver.LOOKUPS.update(fake_resolver(args.latency / 1000, args.fail_rate))
+    os.environ.pop("SSH_CONNECT_SORT", None)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home  # snapshots and caches go to the throwaway HOME
+        for count in map(int, args.sizes.split(",")):
+            results[str(count)] = metrics = run_size(count, home)
+            if len(results) == 1:
+                print(f"{'hosts':>6}  " + "  ".join(f"{name:>11}" for name in metrics))
+            print(f"{count:>6}  " + "  ".join(f"{value:11.2f}" for value in metrics.values()))
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        print("no baseline to compare against (run with --save first)")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"FAIL: slower than the baseline by more than {args.tolerance}x:")
+        print("\n".join(regressions))
+        return 1
+    print("ok: no regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
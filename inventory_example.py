@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Example inventory source for ssh_connect.
+
+Prints host records as JSON, the same keys as under `hosts:` in the
+config file. Point a source at it to try the plugin interface:
+
+    settings:
+      sources:
+        - name: example
+          command: python3 /path/to/inventory_example.py
+          ttl: 600
+
+A real source would query a CMDB or cloud API here instead.
+"""
+import json
+import sys
+
+
+def hosts():
+    """Also usable as an entry point: `entry_point: inventory_example:hosts`."""
+    return [
+        {"host": f"app{n:02d}.example.com", "user": "deploy", "group": "app", "tags": ["example"]}
+        for n in range(1, 6)
+    ] + [
+        {"host": "10.0.0.10", "name": "Bastion", "port": 2222},
+    ]
+
+
+if __name__ == "__main__":
+    json.dump({"hosts": hosts()}, sys.stdout)
@@ -1,14 +1,23 @@
 import os
+import sys
+import time
 import argparse
+from functools import cached_property
 
-from prompt_toolkit.formatted_text import HTML
-from prompt_toolkit.shortcuts import print_formatted_text
-
-from .themes import get_style, THEMES
-from .config import load_config, DEFAULT_CONFIG_PATH
-from .ui.selector import select_host
+# Keep module-level imports light: prompt_toolkit, the selector and the
+# themes are only imported on the paths that draw UI, so scripted calls
+# (--list, --themes, --edit, <index>) start fast.
+from . import profiling  # first, so the "imports" span covers the rest
+from .themes import THEMES
+from .config import (
+    load_config, resolve_in_background, refresh_sources_in_background, watch_config,
+    DEFAULT_CONFIG_PATH,
+)
 from .session import start_session
-from .utils import save_last_pos, load_last_pos
+from .mux import run_mux_command
+from .health import check_all, check_in_background, print_status_table, PENDING
+from .sorting import Sorter, sort_mode
+from .listing import FORMATS, FIELDS
 
 
 def print_themes():
@@ -38,30 +47,187 @@ def parse_args():
     parser.add_argument("--list", action="store_true")
     parser.add_argument("--edit", action="store_true")
     parser.add_argument("--themes", action="store_true")
+    parser.add_argument("--refresh-dns", action="store_true",
+                        help="ignore the DNS cache and look up every host again")
+    parser.add_argument("--mux", choices=["list", "check", "stop"],
+                        help="list, check or stop multiplexed master connections")
+    parser.add_argument("--check", action="store_true",
+                        help="check reachability of all hosts and print a status table")
+    parser.add_argument("--auth", action="store_true",
+                        help="with --check: also test key-based login (BatchMode)")
+    parser.add_argument("--exec", metavar="CMD", dest="command",
+                        help="run CMD on several hosts (picked in the selector, or by --hosts/--filter)")
+    parser.add_argument("--push", nargs=2, metavar=("LOCAL", "REMOTE"),
+                        help="copy LOCAL to REMOTE on several hosts")
+    parser.add_argument("--pull", nargs=2, metavar=("REMOTE", "LOCAL"),
+                        help="copy REMOTE from several hosts into LOCAL/<host>/")
+    parser.add_argument("--hosts", metavar="RANGES",
+                        help="with --exec/--push/--pull: host numbers as in --list, e.g. 1-5,8,12-")
+    parser.add_argument("--filter", metavar="QUERY",
+                        help="with --list/--check/--exec/--push/--pull: hosts matching QUERY "
+                             "like in the selector's search")
+    parser.add_argument("--format", choices=FORMATS, default="table",
+                        help="with --list/--check: output format")
+    parser.add_argument("--fields", metavar="FIELDS",
+                        help=f"with --list/--check: comma-separated columns out of {', '.join(FIELDS)}")
+    parser.add_argument("--where", metavar="EXPR", action="append",
+                        help="with --list/--check: only hosts where EXPR holds, e.g. user=root, "
+                             "port!=22, name~^web, latency<50 (repeatable)")
+    parser.add_argument("--unsorted", action="store_true",
+                        help="with --list/--check: print each host as soon as it is ready")
+    parser.add_argument("--stats", action="store_true",
+                        help="connect latency per host and group from the recorded session metrics")
+    parser.add_argument("--daemon", choices=["run", "status", "stop"],
+                        help="run, query or stop the background daemon that keeps the hosts resolved")
+    parser.add_argument("--profile", action="store_true",
+                        help="print where the time went on exit")
+    parser.add_argument("--profile-file", metavar="TRACE_FILE",
+                        help="--profile, and also write a Chrome trace to TRACE_FILE")
     return parser.parse_args()
 
 
 class SSHConnect:
-    def __init__(self):
+    def __init__(self, args=None):
+        self.args = args or parse_args()
+        if self.args.profile or self.args.profile_file:
+            profiling.enable(self.args.profile_file)
+        else:
+            profiling.enable_from_env()
+        profiling.record("imports", profiling.STARTED, time.perf_counter())
         self.config_file = os.path.expanduser(
             os.getenv("SSH_CONNECT_HOSTS_FILE", DEFAULT_CONFIG_PATH)
         )
-        self.settings, self.connections = load_config(self.config_file)
+        # History entries when the hosts came from the daemon, else None
+        self.served_history = None
+        # Probes hosts under the selector's cursor ahead of the session
+        self.prober = None
+
+    @property
+    def interactive(self):
+        args = self.args
+        if args.command is not None or args.push or args.pull:
+            return not (args.hosts or args.filter)
+        return not (args.list or args.edit or args.themes or args.mux or args.daemon
+                    or args.check or args.stats or args.index is not None)
+
+    @cached_property
+    def config(self):
+        # Loaded on first use only, so --edit/--themes/--mux never parse the
+        # host file; the interactive selector resolves hosts while it is shown
+        return self.load()
+
+    def load(self, on_resolved=None):
+        """(settings, sorted hosts); on_resolved(host) as each one is ready."""
+        if not self.args.refresh_dns:
+            from .daemon import fetch
+
+            # A running daemon has them parsed, resolved and checked already
+            with profiling.span("daemon.fetch"):
+                served = fetch(self.config_file)
+            if served is not None:
+                settings, hosts, self.served_history = served
+                for host in hosts if on_resolved else ():
+                    on_resolved(host)
+                return settings, Sorter(sort_mode(settings)).sort(hosts)
+        with profiling.span("config.load"):
+            return load_config(
+                self.config_file,
+                refresh_dns=self.args.refresh_dns,
+                resolve=not self.interactive,
+                on_resolved=on_resolved,
+            )
+
+    @property
+    def settings(self):
+        return self.config[0]
+
+    @property
+    def connections(self):
+        return self.config[1]
+
+    @cached_property
+    def style(self):
+        from .themes import get_style
 
         # Env var overrides config-file theme
-        theme = os.getenv("SSH_CONNECT_THEME", self.settings.theme)
-        self.style = get_style(theme)
+        return get_style(os.getenv("SSH_CONNECT_THEME", self.settings.theme))
+
+    def announce(self, con, styled):
+        if not styled:
+            print(f"Connecting to: {con.resolved_name}")
+            return
+
+        from prompt_toolkit.formatted_text import HTML
+        from prompt_toolkit.shortcuts import print_formatted_text
+
+        print_formatted_text(
+            HTML(f"<question>Connecting to:</question> <n>{con.resolved_name}</n>"),
+            style=self.style,
+        )
+
+    @cached_property
+    def history(self):
+        from .history import History
+
+        return History(entries=self.served_history)
+
+    def connect(self, con):
+        """Run the session and record it in the history."""
+        settings = self.settings
+        timings = {} if settings.session_metrics else None
+        started = time.time()
+        result = start_session(con, lambda: self.style, settings, self.prober, timings)
+        status = result.returncode if result is not None else None
+        # ssh exits with 255 when the connection itself failed
+        self.history.record(
+            con.key, started, time.time() - started, status,
+            ok=status is not None and status != 255,
+            timings=timings, keep_days=settings.metrics_days,
+        )
+        return result
+
+    def print_list(self, check=False):
+        """--list (and --check with --format/--fields/--where): one row per host."""
+        from .listing import Writer, parse_fields, host_filter
+
+        args = self.args
+        fields = parse_fields(args.fields, args.format)
+        if check and not args.fields:
+            fields = fields + ["status", "latency"]
+        if args.unsorted and "index" in fields:
+            if args.fields:
+                print("ERROR: --unsorted output has no index field")
+                sys.exit(1)
+            fields.remove("index")
 
-    def print_list(self):
-        for i, c in enumerate(self.connections, 1):
-            print(f"{i:<3} {c['resolved_name']:<25} {c['resolved_ip']}")
+        # Loaded first where all hosts are needed anyway, so a daemon can
+        # supply the history too
+        connections = self.connections if check or not args.unsorted else None
+        writer = Writer(args.format, fields, self.history)
+        wanted = host_filter(args.where, args.filter, self.history)
+
+        def emit(con, index=None):
+            if wanted(con):
+                writer.write(con, index)
+
+        if args.unsorted and check:
+            check_all(connections, self.settings, auth=args.auth, on_result=emit)
+        elif args.unsorted:
+            # Rows go out as each host's lookups finish
+            self.config = self.load(on_resolved=emit)
+        else:
+            if check:
+                check_all(connections, self.settings, auth=args.auth)
+            for i, con in enumerate(connections, 1):
+                emit(con, i)
+        writer.close()
 
     def edit_file(self):
         editor = os.getenv("EDITOR", "nano")
         os.execvp(editor, [editor, self.config_file])
 
     def run(self):
-        args = parse_args()
+        args = self.args
 
         if args.list:
             return self.print_list()
@@ -73,24 +239,147 @@ class SSHConnect:
             print_themes()
             return
 
+        if args.mux:
+            return run_mux_command(args.mux)
+
+        if args.stats:
+            from .stats import print_stats
+
+            # Only to map host keys to groups: no need to resolve anything
+            settings, hosts = load_config(self.config_file, resolve=False)
+            return print_stats(hosts, self.history, settings.metrics_days)
+
+        if args.daemon:
+            from .daemon import run_daemon_command
+
+            return run_daemon_command(args.daemon)
+
+        if args.check:
+            if args.format == "table" and not (args.fields or args.where or args.filter or args.unsorted):
+                return print_status_table(self.connections, self.settings, auth=args.auth)
+            return self.print_list(check=True)
+
+        if args.command is not None:
+            return self.exec_command(args.command)
+
+        if args.push or args.pull:
+            return self.copy_files()
+
         if args.index is not None:
             idx = args.index - 1
             if 0 <= idx < len(self.connections):
                 con = self.connections[idx]
-                print_formatted_text(
-                    HTML(f"<question>Connecting to:</question> <n>{con['resolved_name']}</n>"),
-                    style=self.style,
-                )
-                return start_session(con, idx, self.style, save_last_pos, self.settings)
-
-        last = load_last_pos()
-        pos = select_host(self.connections, last, style=self.style)
-        if pos is None:
+                self.announce(con, styled=False)
+                return self.connect(con)
+
+        return self.select_and_connect()
+
+    def pick_hosts(self):
+        """Hosts for --exec/--push/--pull: by --hosts/--filter or marked in the selector."""
+        from .broadcast import parse_ranges, filter_hosts
+
+        args = self.args
+        connections = self.connections
+        if args.hosts:
+            try:
+                connections = [connections[i] for i in parse_ranges(args.hosts, len(connections))]
+            except ValueError as e:
+                print(f"ERROR: invalid --hosts: {e}")
+                sys.exit(1)
+        if args.filter:
+            connections = filter_hosts(connections, args.filter)
+        if self.interactive:
+            picked = self.select(multi=True)
+            if not picked:
+                return []
+            connections = [connections[i] for i in picked]
+        if not connections:
+            print("No hosts selected.")
+        return connections
+
+    def exec_command(self, command):
+        from .broadcast import broadcast
+
+        connections = self.pick_hosts()
+        if not connections:
             return
 
-        con = self.connections[pos]
-        print_formatted_text(
-            HTML(f"<question>Connecting to:</question> <n>{con['resolved_name']}</n>"),
+        results = broadcast(connections, command, self.settings)
+        if any(results.get(c) != 0 for c in connections):
+            sys.exit(1)
+
+    def copy_files(self):
+        from .transfer import transfer, PUSH, PULL
+
+        connections = self.pick_hosts()
+        if not connections:
+            return
+
+        direction, (source, target) = (PUSH, self.args.push) if self.args.push else (PULL, self.args.pull)
+        results = transfer(connections, direction, source, target, self.settings, style=self.style)
+        if any(results.get(c) != 0 for c in connections):
+            sys.exit(1)
+
+    def select(self, multi=False):
+        from .ui.selector import select_host
+
+        settings = self.settings
+        top = self.history.top(self.connections, max(1, settings.top_hosts))
+        pinned = top if settings.top_hosts > 0 else []
+
+        def resolve(hosts, on_update):
+            return resolve_in_background(hosts, settings, on_update, self.args.refresh_dns)
+
+        eager = self.connections
+        if settings.collapse_groups:
+            # Grouped hosts are resolved when their group is first expanded
+            eager = [c for c in self.connections if c.group is None or c in pinned]
+
+        # The daemon keeps its hosts resolved, checked and its sources fresh
+        served = self.served_history is not None
+        tasks = []
+        if not served:
+            tasks.append(lambda on_update: resolve(eager, on_update))
+        if settings.sources and not served:
+            tasks.append(lambda on_update: refresh_sources_in_background(
+                self.config_file, settings, on_update
+            ))
+        if settings.watch_config:
+            tasks.append(lambda on_update: watch_config(self.config_file, settings, on_update))
+        if self.settings.check_hosts and not (
+            served and all(c.status is not None for c in self.connections)
+        ):
+            for con in self.connections:
+                con.status = PENDING
+            tasks.append(lambda on_update: check_in_background(
+                self.connections, self.settings, on_update
+            ))
+
+        if not multi and settings.probe_on_cursor:
+            from .prober import Prober
+
+            self.prober = Prober(settings)
+
+        sorter = Sorter(sort_mode(settings), self.history)
+        return select_host(
+            self.connections,
+            top[0] if top else None,
             style=self.style,
+            tasks=tasks,
+            sorter=sorter,
+            pinned=pinned,
+            multi=multi,
+            groups=settings.collapse_groups,
+            on_expand=resolve if settings.collapse_groups and not served else None,
+            on_cursor=self.prober.rest_on if self.prober else None,
+            latencies=self.history.latencies() if settings.show_latency else None,
         )
-        start_session(con, pos, self.style, save_last_pos, self.settings)
+
+    def select_and_connect(self):
+        pos = self.select()
+        if pos is None:
+            return
+
+        con = self.connections[pos]
+        self.announce(con, styled=True)
+        self.connect(con)
@@ -0,0 +1,143 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from .jump import jump_options
+from .mux import mux_options
+from .pool import run_jobs
+from .search import FuzzyFilter
+
+TIMED_OUT = "timeout"
+
+
+def parse_ranges(spec, count):
+    """
+    Host indices (0-based) for a 1-based range list like "1-5,8,12-".
+
+    Raises ValueError for malformed or out-of-range parts.
+    """
+    indices = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        start = int(first) if first else 1
+        end = (int(last) if last else count) if dash else start
+        if not 1 <= start <= end <= count:
+            raise ValueError(f"range {part!r} outside 1-{count}")
+        indices.extend(range(start - 1, end))
+    return list(dict.fromkeys(indices))
+
+
+def filter_hosts(connections, query):
+    """Hosts matching `query` the same way typing it in the selector would."""
+    search = FuzzyFilter(connections)
+    search.set_query(query.lower())
+    return [connections[i] for i in search.matches]
+
+
+def exec_argv(con, command, settings):
+    """ssh command line running `command` on `con` without a terminal."""
+    target = [*mux_options(settings, con), *jump_options(con, settings),
+              f"{con.user}@{con.resolved_ip}", "-p", str(con.port)]
+    if con.password and shutil.which("sshpass"):
+        return ["sshpass", "-p", con.password, "ssh", *target, command]
+    return [
+        "ssh", "-o", "BatchMode=yes",
+        "-o", f"ConnectTimeout={max(1, round(settings.check_timeout))}",
+        *target, command,
+    ]
+
+
+def _kill(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def run_on_host(con, command, settings, emit, running=None):
+    """
+    Run `command` on one host, passing each output line to emit(con, line).
+    Returns the exit status, or TIMED_OUT if it ran past exec_timeout.
+    The process is kept in the `running` set while it runs.
+    """
+    proc = subprocess.Popen(
+        exec_argv(con, command, settings),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        # Own process group, so a timeout also kills ssh under sshpass
+        start_new_session=True,
+    )
+    if running is not None:
+        running.add(proc)
+    timer = None
+    killed = threading.Event()
+    if settings.exec_timeout > 0:
+        def kill():
+            killed.set()
+            _kill(proc)
+        timer = threading.Timer(settings.exec_timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        for line in proc.stdout:
+            emit(con, line.rstrip("\n"))
+        proc.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        if running is not None:
+            running.discard(proc)
+    return TIMED_OUT if killed.is_set() else proc.returncode
+
+
+def broadcast(connections, command, settings, out=None):
+    """
+    Run `command` on all `connections`, at most exec_workers at a time.
+
+    Output is streamed as it arrives, each line prefixed with the host's
+    name. Prints a summary and returns {host: exit status or TIMED_OUT}.
+    """
+    out = out or sys.stdout
+    width = max((len(c.resolved_name) for c in connections), default=0)
+    lock = threading.Lock()
+
+    def emit(con, line):
+        with lock:
+            out.write(f"{con.resolved_name:<{width}} | {line}\n")
+            out.flush()
+
+    running = set()
+    start = time.monotonic()
+    # Timeouts are enforced per process (see run_on_host), not by the pool,
+    # so a hung ssh is killed instead of left running
+    try:
+        results = run_jobs(
+            lambda con: run_on_host(con, command, settings, emit, running),
+            connections,
+            settings.exec_workers,
+        )
+    except KeyboardInterrupt:
+        for proc in list(running):
+            _kill(proc)
+        raise
+    elapsed = time.monotonic() - start
+
+    failed = [c for c in connections if results.get(c, -1) != 0]
+    print(f"\n{len(connections) - len(failed)} of {len(connections)} hosts ok "
+          f"in {elapsed:.1f}s", file=out)
+    for con in failed:
+        # Missing from results: ssh could not even be started
+        status = results.get(con, "not run")
+        print(f"  {con.resolved_name:<{width}} {con.resolved_ip:<18} exit {status}", file=out)
+    return results
@@ -1,9 +1,14 @@
-import re
+import glob
 import os
 import sys
-import yaml
-import socket
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field, fields, asdict
+
+from . import profiling
+from .host import Host, is_ip
+from .resolver import DnsCache, resolve_many, revalidate_in_background
+from .snapshot import load_snapshot, save_snapshot
+from .sorting import Sorter, sort_mode
 
 
 DEFAULT_CONFIG_PATH = "~/.ssh_connect.yml"
@@ -12,34 +17,453 @@ DEFAULT_CONFIG_PATH = "~/.ssh_connect.yml"
 @dataclass
 class Settings:
     theme: str = "material"
+    sort: str = "ip"
     resolve_dns: bool = True
     skip_key_setup: bool = False
+    dns_workers: int = 32
+    dns_timeout: float = 2.0
+    dns_cache: bool = True
+    dns_cache_ttl: int = 86400
+    dns_negative_ttl: int = 600
+    dns_cache_size: int = 20000
+    multiplex: bool = False
+    control_persist: str = "10m"
+    check_hosts: bool = False
+    check_workers: int = 200
+    check_timeout: float = 2.0
+    top_hosts: int = 0
+    collapse_groups: bool = False
+    import_ssh_config: bool = False
+    import_known_hosts: bool = False
+    watch_config: bool = True
+    sources: list = field(default_factory=list)
+    exec_workers: int = 32
+    exec_timeout: float = 300.0
+    transfer_workers: int = 8
+    transfer_retries: int = 2
+    session_metrics: bool = False
+    metrics_days: int = 90
+    show_latency: bool = False
+    probe_on_cursor: bool = True
+
+
+GROUP_DEFAULTS = ("user", "port", "skip_key_setup", "password", "proxy_jump")
+# Other names accepted for a key of a host or group
+ALIASES = {"jump": "proxy_jump"}
+
+# Host.source of hosts imported from ~/.ssh
+IMPORTED = "~/.ssh"
+
+
+class ConfigError(Exception):
+    """The config file or one of its fragments can't be used."""
 
 
-def load_config(path):
+def load_config(path, refresh_dns=False, resolve=True, on_resolved=None):
+    """
+    Load settings and host entries from `path` and the fragment files it
+    includes.
+
+    With resolve=False the entries only carry placeholder names/IPs (as if
+    resolve_dns were off); pass them to resolve_in_background() to fill in
+    the DNS results while the UI is already running. Otherwise
+    on_resolved(host), if given, is called for each host as soon as it is
+    resolved, before the sorted list is returned.
+    """
     path = os.path.expanduser(path)
 
     if not os.path.exists(path):
         print(f"ERROR: Config file not found: {path}")
         sys.exit(1)
 
+    try:
+        with profiling.span("config.documents"):
+            settings, documents, groups = _load_documents(path)
+        with profiling.span("config.build_hosts"):
+            hosts = _build_hosts(documents, groups, settings)
+        extra = _extra_hosts(settings, groups, refresh_stale=resolve)
+    except ConfigError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    hosts += _dedupe(hosts, extra)
+
+    if resolve:
+        with profiling.span("dns.resolve", hosts=len(hosts)):
+            _resolve_hosts(hosts, settings, refresh_dns, on_done=on_resolved)
+
+    return settings, Sorter(sort_mode(settings)).sort(hosts)
+
+
+def _extra_hosts(settings, groups, refresh_stale):
+    """Hosts of the other sources, in order of precedence after the config files."""
+    extra = []
+    if settings.sources:
+        from .inventory import cached_documents
+
+        # Scripted calls wait for stale sources; the selector shows the
+        # cache and refreshes in the background (refresh_sources_in_background)
+        with profiling.span("config.sources"):
+            extra += _build_hosts(
+                cached_documents(settings, refresh_stale=refresh_stale), groups, settings, strict=False
+            )
+    if settings.import_ssh_config or settings.import_known_hosts:
+        from .sshconfig import imported_entries
+
+        with profiling.span("config.import_ssh"):
+            extra += _build_hosts(
+                [("~/.ssh", {"hosts": imported_entries(settings), "source": IMPORTED})],
+                groups, settings, strict=False,
+            )
+    return extra
+
+
+def _make_settings(raw_settings):
+    return Settings(**{
+        f.name: raw_settings[f.name]
+        for f in fields(Settings)
+        if f.name in raw_settings
+    })
+
+
+def _load_documents(path, quiet=False):
+    """
+    Settings, [(path, document)] of the config file and its fragments, and
+    all groups. Raises ConfigError; `quiet` leaves out warnings as well.
+    """
+    document = _load_document(path, main=True, quiet=quiet)
+    if document is None:
+        return Settings(), [], {}
+
+    groups = dict(document["groups"])
+    documents = [(path, document)]
+    for fragment, doc in _includes(path, document, {os.path.abspath(path)}, quiet):
+        groups.update(doc["groups"])
+        documents.append((fragment, doc))
+    return _make_settings(document["settings"]), documents, groups
+
+
+def _includes(path, document, seen, quiet):
+    """
+    (path, document) of the fragments included by `document`, depth first.
+    Patterns are globs relative to the including file; each file is read once.
+    """
+    base = os.path.dirname(path)
+    for pattern in document["include"]:
+        pattern = os.path.join(base, os.path.expanduser(str(pattern)))
+        for fragment in sorted(glob.glob(pattern)):
+            key = os.path.abspath(fragment)
+            if key in seen or not os.path.isfile(fragment):
+                continue
+            seen.add(key)
+            doc = _load_document(fragment, quiet=quiet)
+            if doc is not None:
+                yield fragment, doc
+                yield from _includes(fragment, doc, seen, quiet)
+
+
+def _load_document(path, main=False, quiet=False):
+    """The parsed file, from its snapshot when unchanged; None if empty."""
     try:
         with open(path, "r") as f:
             raw = f.read().strip()
     except Exception as e:
-        print(f"ERROR: Cannot read {path}:\n{e}")
-        sys.exit(1)
+        raise ConfigError(f"Cannot read {path}:\n{e}")
 
     if not raw:
-        return Settings(), []
+        return None
+
+    return load_snapshot(path, raw) or _parse_config(path, raw, main, quiet)
+
+
+def _group_defaults(name, groups, chain=()):
+    """Defaults of group `name`, merged down from its parent groups."""
+    if name in chain:
+        raise ConfigError(f"Group {name!r} is its own parent ({' -> '.join(chain + (name,))})")
+    group = groups.get(name) or {}
+    if not isinstance(group, dict):
+        raise ConfigError(f"Group {name!r} must be a mapping, got {group!r}")
+    group = _unalias(group)
+    parent = group.get("parent")
+    merged = dict(_group_defaults(str(parent), groups, chain + (name,))) if parent else {}
+    merged.update((k, group[k]) for k in GROUP_DEFAULTS if k in group)
+    merged["tags"] = [*merged.get("tags", ()), *_tags(group.get("tags"))]
+    return merged
+
+
+def _unalias(mapping):
+    if not any(alias in mapping for alias in ALIASES):
+        return mapping
+    return {ALIASES.get(k, k): v for k, v in mapping.items()}
+
+
+def _tags(value):
+    if not value:
+        return []
+    return [str(t) for t in value] if isinstance(value, list) else [str(value)]
+
+
+def _build_hosts(documents, groups, settings, strict=True):
+    """
+    Hosts of all documents. An invalid entry is an error (ConfigError) in
+    our own config files (strict); in data from elsewhere it is skipped.
+    """
+    # Resolved once per group, not per host
+    defaults = {}
+    hosts = []
+    for path, document in documents:
+        for n, entry in enumerate(document["hosts"], 1):
+            if isinstance(entry, dict):
+                entry = _unalias(entry)
+                group = entry.get("group") or document.get("group")
+                if group:
+                    if group not in defaults:
+                        defaults[group] = _group_defaults(group, groups)
+                    inherited = defaults[group]
+                    entry = {
+                        **inherited, **entry,
+                        "group": group,
+                        "tags": inherited["tags"] + _tags(entry.get("tags")),
+                    }
+            try:
+                host = Host.from_entry(entry, settings)
+            except ValueError as e:
+                if not strict:
+                    continue
+                raise ConfigError(f"Invalid host entry #{n} in {path}: {e}")
+            host.source = document.get("source")
+            _apply_resolution(host, {}, {})
+            hosts.append(host)
+    _link_jumps(hosts, strict)
+    return hosts
+
+
+def _link_jumps(hosts, strict=True):
+    """
+    Spell out jump hosts that are hosts of the config: "bastion" becomes
+    its user@host:port, preceded by the bastion's own jump hosts.
+    """
+    from .jump import format_hop, parse_hop
+
+    by_name = {}
+    for host in hosts:
+        for name in (host.host, host.name):
+            if name:
+                by_name.setdefault(name.lower(), host)
+
+    def expand(spec, chain):
+        hops = []
+        for hop in spec.split(","):
+            user, name, port = parse_hop(hop)
+            jump = by_name.get(name.lower()) if user is None and port is None else None
+            if jump is None:
+                hops.append(format_hop(user, name, port))
+                continue
+            if jump in chain:
+                names = " -> ".join(h.name or h.host for h in chain + (jump,))
+                raise ValueError(f"jump hosts loop ({names})")
+            if jump.proxy_jump:
+                hops.append(expand(jump.proxy_jump, chain + (jump,)))
+            hops.append(format_hop(jump.user, jump.host, jump.port))
+        return ",".join(hops)
+
+    expanded = {}
+    for host in hosts:
+        if host.proxy_jump:
+            try:
+                expanded[host] = expand(host.proxy_jump, (host,))
+            except ValueError as e:
+                if strict:
+                    raise ConfigError(f"Invalid proxy_jump of {host.name or host.host}: {e}")
+                expanded[host] = None
+    for host, spec in expanded.items():
+        host.set_proxy_jump(spec)
+    hosts[:] = [h for h in hosts if h.proxy_jump or h not in expanded]
+
+
+def _dedupe(hosts, extra):
+    """
+    The hosts of `extra` not already in `hosts` (or earlier in `extra`)
+    under the same host name or alias, port and jump hosts. One without
+    jump hosts (known_hosts has none) matches on name and port alone.
+    """
+    seen = set()
+
+    def known(host):
+        names = {host.host.lower(), (host.name or host.host).lower()}
+        jump = host.proxy_jump
+        if any((name, host.port, jump) in seen or (not jump and (name, host.port) in seen)
+               for name in names):
+            return True
+        seen.update((name, host.port, jump) for name in names)
+        seen.update((name, host.port) for name in names)
+        return False
+
+    for host in hosts:
+        known(host)
+    return [host for host in extra if not known(host)]
+
+
+def refresh_sources_in_background(path, settings, on_update, resolve=None):
+    """
+    Fetch the stale `sources` on a daemon thread. Once they are in,
+    on_update(apply) is called; apply(hosts) must run on the thread that
+    owns the host list: it swaps in the refreshed hosts (reusing the Host
+    of any host that is still there) and starts resolving the new ones
+    with resolve(hosts) (resolve_in_background by default).
+    """
+    if resolve is None:
+        def resolve(hosts):
+            resolve_in_background(hosts, settings, on_update)
+
+    def run():
+        from .inventory import source_specs, stale_specs, fetch_all, documents
 
+        specs = stale_specs(source_specs(settings))
+        records = fetch_all(specs)
+        if not records:
+            return
+        try:
+            _, _, groups = _load_documents(os.path.expanduser(path), quiet=True)
+            fresh = _build_hosts(documents(specs, records), groups, settings, strict=False)
+        except ConfigError:
+            return  # the config watcher picks up the fixed file
+
+        def apply(hosts):
+            old = {h.key: h for h in hosts if h.source in records}
+            # Same precedence as load_config: config files, sources, ~/.ssh
+            kept = [h for h in hosts if h.source not in records and h.source != IMPORTED]
+            imported = [h for h in hosts if h.source == IMPORTED]
+            current = [old.get(h.key, h) for h in _dedupe(kept, fresh)]
+            hosts[:] = kept + current + _dedupe(kept + current, imported)
+            new = [h for h in current if h.key not in old]
+            if new:
+                resolve(new)
+
+        on_update(apply)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _watched(documents):
+    """Files the config consists of, and the include globs that may add more."""
+    files = [path for path, _ in documents]
+    patterns = [
+        os.path.join(os.path.dirname(path), os.path.expanduser(str(p)))
+        for path, doc in documents
+        for p in doc.get("include", ())
+    ]
+    return files, patterns
+
+
+def _file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def watch_config(path, settings, on_update, interval=1.0, resolve=None):
+    """
+    Reload the host entries when the config file or one of its fragments
+    changes, while the selector is open.
+
+    The new entries are diffed against the shown ones by Host.key: hosts
+    that are unchanged keep their Host (and DNS result), changed ones are
+    updated in place (so the cursor stays on them) and only new or changed
+    hosts are resolved, with resolve(hosts) (resolve_in_background by
+    default). The swap is handed to on_update(change) so it runs on the UI
+    thread. Settings changes need a restart.
+    """
+    from .watch import watch
+
+    if resolve is None:
+        def resolve(hosts):
+            resolve_in_background(hosts, settings, on_update)
+
+    path = os.path.expanduser(path)
+    files = patterns = None
+
+    def state():
+        nonlocal files, patterns
+        if files is None:
+            # On the watcher thread: the selector doesn't wait for this
+            try:
+                files, patterns = _watched(_load_documents(path, quiet=True)[1])
+            except ConfigError:
+                files, patterns = [path], []
+        return (
+            [(f, _file_state(f)) for f in files],
+            [sorted(glob.glob(p)) for p in patterns],
+        )
+
+    def dirs():
+        return {os.path.dirname(os.path.abspath(p)) for p in files + patterns
+                if not glob.has_magic(os.path.dirname(p))}
+
+    def reload():
+        nonlocal files, patterns
+        # Errors (e.g. an editor's half-written save) would be printed over
+        # the UI; keep the old hosts until the next change instead
+        try:
+            _, documents, groups = _load_documents(path, quiet=True)
+            fresh = _build_hosts(documents, groups, settings)
+        except ConfigError:
+            return
+        files, patterns = _watched(documents)
+        on_update(lambda hosts: _swap_config_hosts(hosts, fresh, resolve))
+
+    return watch(state, dirs, reload, interval)
+
+
+def _swap_config_hosts(hosts, fresh, resolve):
+    old = {h.key: h for h in hosts if h.source is None}
+    current, changed = [], []
+    for host in fresh:
+        known = old.get(host.key)
+        if known is None:
+            changed.append(host)
+            current.append(host)
+            continue
+        if _config_fields(known) != _config_fields(host):
+            for attr in ("name", "password", "skip_key_setup", "group", "tags"):
+                setattr(known, attr, getattr(host, attr))
+            _apply_resolution(known, {}, {})
+            changed.append(known)
+        current.append(known)
+
+    others = [h for h in hosts if h.source is not None]
+    hosts[:] = current + _dedupe(current, others)
+    if changed:
+        resolve(changed)
+
+
+def _config_fields(host):
+    return (host.name, host.password, host.skip_key_setup, host.group, host.tags)
+
+
+def _parse_config(path, raw, main=True, quiet=False):
+    # Imported here: a snapshot hit never needs PyYAML at all
+    import yaml
+
+    # libyaml's C loader is many times faster than the pure-Python one
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     try:
-        data = yaml.safe_load(raw)
+        with profiling.span("config.parse_yaml", path=path):
+            data = yaml.load(raw, Loader=loader)
     except Exception as e:
-        print(f"ERROR: Invalid YAML in {path}:\n{e}")
-        sys.exit(1)
+        raise ConfigError(f"Invalid YAML in {path}:\n{e}")
 
     if isinstance(data, list):
+        document = {"settings": {}, "include": [], "groups": {}, "group": None, "hosts": data}
+        if not main:
+            # A fragment may just be a list of hosts
+            save_snapshot(path, raw, document)
+            return document
+        if quiet:
+            return document
         print(f"WARNING: {path} uses the old format (plain host list).")
         print("Please migrate to the new format:")
         print("  settings:")
@@ -48,85 +472,157 @@ def load_config(path):
         print("    skip_key_setup: false")
         print("  hosts:")
         print("    - host: ...")
-        settings = Settings()
-        entries = data
-    elif isinstance(data, dict):
-        raw_settings = data.get("settings") or {}
-        settings = Settings(
-            theme=raw_settings.get("theme", "material"),
-            resolve_dns=raw_settings.get("resolve_dns", True),
-            skip_key_setup=raw_settings.get("skip_key_setup", False),
-        )
-        entries = data.get("hosts") or []
-    else:
-        print("ERROR: Config must be a mapping with 'settings' and 'hosts' keys.")
-        sys.exit(1)
+        # Not snapshotted, so the warning keeps showing until migrated
+        return document
 
-    return settings, _resolve_hosts(entries, settings.resolve_dns)
+    if isinstance(data, dict):
+        include = data.get("include") or []
+        document = {
+            # Only the main file's settings count
+            "settings": asdict(_make_settings(data.get("settings") or {})) if main else {},
+            "include": include if isinstance(include, list) else [include],
+            "groups": {str(k): v for k, v in (data.get("groups") or {}).items()},
+            # Default group for all hosts of a fragment
+            "group": str(data["group"]) if data.get("group") else None,
+            "hosts": data.get("hosts") or [],
+        }
+        save_snapshot(path, raw, document)
+        return document
 
+    raise ConfigError(f"{path} must be a mapping with 'settings' and 'hosts' keys.")
 
-def _resolve_hosts(entries, resolve_dns):
-    for entry in entries:
-        host = entry["host"]
-        pretty = entry.get("name")
 
-        if pretty:
-            entry["resolved_name"] = pretty
-            entry["resolved_ip"] = _resolve_hostname(host) if resolve_dns else host
-            continue
+def resolve_in_background(hosts, settings, on_update, refresh_dns=False):
+    """
+    Resolve hosts on a daemon thread, updating them in place.
+    on_update() is called (from that thread) whenever a host changed.
+    """
+    # Copied here: the selector re-sorts its list in place, and while
+    # list.sort() runs the list looks empty to other threads
+    hosts = list(hosts)
 
-        if is_ip(host):
-            entry["resolved_ip"] = host
-            if resolve_dns:
-                try:
-                    rev = socket.gethostbyaddr(host)[0]
-                    entry["resolved_name"] = rev.split(".")[0].capitalize()
-                except Exception:
-                    entry["resolved_name"] = "Unknown"
-            else:
-                entry["resolved_name"] = "Unknown"
-            continue
+    def run():
+        with profiling.span("dns.resolve", hosts=len(hosts)):
+            _resolve_hosts(hosts, settings, refresh_dns, on_update)
 
-        if "." in host:
-            entry["resolved_ip"] = _resolve_hostname(host) if resolve_dns else host
-            entry["resolved_name"] = host.split(".")[0].capitalize()
-            continue
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
 
-        # Simple hostname
-        ip = _resolve_hostname(host) if resolve_dns else host
-        entry["resolved_ip"] = ip
 
-        if resolve_dns and is_ip(ip):
-            try:
-                rev = socket.gethostbyaddr(ip)[0]
-                entry["resolved_name"] = rev.split(".")[0].capitalize()
-            except Exception:
-                entry["resolved_name"] = host.capitalize()
-        else:
-            entry["resolved_name"] = host.capitalize()
+def _resolve_hosts(hosts, settings, refresh_dns=False, on_update=None, on_done=None):
+    """
+    Look up names and addresses of `hosts` and update them in place.
 
-    mode = os.getenv("SSH_CONNECT_SORT", "ip").strip().lower()
+    on_update() is called whenever hosts changed; on_done(host) once per
+    host as soon as all its lookups are done (for streamed output), in no
+    particular order. Both may be called from worker threads.
+    """
+    done = set()
+    done_lock = threading.Lock()
 
-    if mode == "name":
-        return sorted(entries, key=lambda x: x["resolved_name"].lower())
+    def finish(candidates):
+        if on_done is None:
+            return
+        for host in candidates:
+            with done_lock:
+                if host in done:
+                    continue
+                done.add(host)
+            on_done(host)
 
-    return sorted(entries, key=lambda x: ip_sort(x["resolved_ip"]))
+    if not settings.resolve_dns:
+        finish(hosts)
+        return
 
+    cache = DnsCache.load(settings, refresh=refresh_dns) if settings.dns_cache else None
+    forward = {}
 
-def _resolve_hostname(host):
-    if is_ip(host):
-        return host
-    try:
-        return socket.gethostbyname(host)
-    except Exception:
-        return host
+    def needs_reverse(host):
+        # A simple hostname is named after the reverse lookup of its address
+        return (not host.name and not is_ip(host.host) and "." not in host.host
+                and is_ip(forward.get(host.host, "")))
+
+    def lookup(kind, targets, tables, stale, complete=lambda host: True):
+        """
+        Resolve the keys of targets ({name: [hosts]}) into tables[kind] and
+        apply the results. Lookups that run at the same time get tables and
+        a stale list of their own.
+        """
+        table = tables[kind]
+
+        def record(name, value):
+            # Apply single results as they arrive, for the live selector
+            table[name] = value
+            for host in targets[name]:
+                _apply_resolution(host, tables["forward"], tables["reverse"])
+            if on_update:
+                on_update()
+            finish(h for h in targets[name] if complete(h))
+
+        table.update(resolve_many(
+            list(targets), kind, settings, cache, stale,
+            on_result=record if on_update or on_done else None,
+        ))
+        # Cached answers (and failures) don't come through record()
+        for group in targets.values():
+            for host in group:
+                _apply_resolution(host, tables["forward"], tables["reverse"])
+        if on_update:
+            on_update()
+        finish(h for group in targets.values() for h in group if complete(h))
+
+    by_name, by_ip = {}, {}
+    for host in hosts:
+        if not is_ip(host.host):
+            by_name.setdefault(host.host, []).append(host)
+        elif not host.name:
+            by_ip.setdefault(host.host, []).append(host)
+    finish(h for h in hosts if h.name and is_ip(h.host))  # nothing to look up
 
+    # Reverse lookups of literal addresses depend on nothing: run them
+    # alongside the forward lookups
+    literal_stale = []
+    literal = threading.Thread(
+        target=lookup, args=("reverse", by_ip, {"forward": {}, "reverse": {}}, literal_stale),
+        daemon=True,
+    )
+    literal.start()
+    stale = []
+    lookup("forward", by_name, {"forward": forward, "reverse": {}}, stale,
+           lambda host: not needs_reverse(host))
 
-def is_ip(s: str):
-    return bool(re.match(r"^\d{1,3}(\.\d{1,3}){3}$", s))
+    targets = {}
+    for host in hosts:
+        if needs_reverse(host):
+            targets.setdefault(forward[host.host], []).append(host)
+    lookup("reverse", targets, {"forward": forward, "reverse": {}}, stale)
+    literal.join()
+    stale += literal_stale
+
+    if cache is not None:
+        cache.save()
+        if stale:
+            revalidate_in_background(cache, stale, settings)
+
+
+def _apply_resolution(entry, forward, reverse):
+    host = entry.host
+    ip = forward.get(host, host)
+
+    if entry.name:
+        entry.set_resolved(entry.name, ip)
+        return
+
+    if is_ip(host):
+        rev = reverse.get(host)
+        entry.set_resolved(rev.split(".")[0].capitalize() if rev else "Unknown", host)
+        return
 
+    if "." in host:
+        entry.set_resolved(host.split(".")[0].capitalize(), ip)
+        return
 
-def ip_sort(ip: str):
-    if is_ip(ip):
-        return tuple(int(n) for n in ip.split("."))
-    return (999, 999, 999, 999)
+    # Simple hostname
+    rev = reverse.get(ip) if ip != host else None
+    entry.set_resolved(rev.split(".")[0].capitalize() if rev else host.capitalize(), ip)
@@ -0,0 +1,298 @@
+import json
+import os
+import pickle
+import socket
+import sys
+import time
+
+from .utils import cache_path
+
+SOCKET_FILE = "ssh_connect.sock"
+# Bump when the reply layout changes; an old daemon is then ignored
+MAGIC = b"SSHCONNECT-DAEMON-1\n"
+
+# How long the CLI waits for the daemon before loading in-process
+CLIENT_TIMEOUT = 2.0
+# Reachability is re-checked (with check_hosts) and DNS revalidated this often
+CHECK_INTERVAL = 60
+RESOLVE_INTERVAL = 300
+
+
+def socket_path():
+    return cache_path(SOCKET_FILE)
+
+
+def _request(message, timeout=CLIENT_TIMEOUT):
+    """Send one JSON request, return the raw reply (b"" if nobody answers)."""
+    path = socket_path()
+    try:
+        # Only trust a socket of our own: replies are unpickled
+        if os.stat(path).st_uid != os.getuid():
+            return b""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+            s.sendall(json.dumps(message).encode() + b"\n")
+            s.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = s.recv(1 << 20)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    except OSError:
+        return b""
+    return b"".join(chunks)
+
+
+def fetch(config_path):
+    """
+    (settings, hosts, history entries) of config_path from a running daemon,
+    with hosts resolved and checked; None if no daemon is running or it has
+    not loaded that config yet (it starts loading it now).
+    """
+    reply = _request({"op": "hosts", "config": os.path.abspath(config_path)})
+    if not reply.startswith(MAGIC):
+        return None
+    try:
+        return pickle.loads(reply[len(MAGIC):])
+    except Exception:
+        return None
+
+
+class Inventory:
+    """
+    One config file's hosts, kept loaded, resolved, checked and watched.
+
+    Handlers pickle the Host objects of `hosts` without the lock, so they
+    are never changed once in there: updates (checks, lookups, config and
+    source changes) work on copies and swap the list under the lock, one
+    update at a time so none undoes another. on_restart() is called when
+    the settings changed.
+    """
+
+    def __init__(self, path, on_restart):
+        import threading
+
+        self.path = path
+        self.on_restart = on_restart
+        self.lock = threading.Lock()
+        self.updating = threading.Lock()
+        self.ready = False
+        self.failed = False
+        self.settings = None
+        self.hosts = []
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        from .config import load_config, watch_config, refresh_sources_in_background
+
+        try:
+            settings, hosts = load_config(self.path)
+        except SystemExit:
+            self.failed = True  # the error went to the daemon's output
+            return
+        with self.lock:
+            self.settings, self.hosts, self.ready = settings, hosts, True
+
+        watch_config(self.path, settings, self.on_update, resolve=self._resolve)
+        if settings.sources:
+            refresh_sources_in_background(self.path, settings, self.on_update, self._resolve)
+        self._refresh()
+
+    def _refresh(self):
+        from .config import _resolve_hosts, refresh_sources_in_background
+        from .health import check_all
+
+        resolved = time.monotonic()
+        while True:
+            if self.settings.check_hosts:
+                self._update(lambda hosts: check_all(hosts, self.settings))
+            time.sleep(CHECK_INTERVAL)
+            if time.monotonic() - resolved >= RESOLVE_INTERVAL:
+                resolved = time.monotonic()
+                # Answers past their TTL are revalidated in the background
+                self._update(lambda hosts: _resolve_hosts(hosts, self.settings))
+                if self.settings.sources:
+                    refresh_sources_in_background(
+                        self.path, self.settings, self.on_update, self._resolve
+                    )
+
+    def _update(self, work, hosts=None):
+        """Run work(copies) on copies of `hosts` (all), then swap them in."""
+        import copy
+
+        with self.updating:
+            with self.lock:
+                originals = list(self.hosts if hosts is None else hosts)
+            copies = [copy.copy(h) for h in originals]
+            work(copies)
+            updated = {id(old): new for old, new in zip(originals, copies)}
+            with self.lock:
+                self.hosts = [updated.get(id(h), h) for h in self.hosts]
+
+    def _resolve(self, hosts):
+        """Resolve new or changed hosts once the change that made them is in."""
+        import threading
+        from .config import _resolve_hosts
+
+        threading.Thread(
+            target=self._update, args=(lambda copies: _resolve_hosts(copies, self.settings), hosts),
+            daemon=True,
+        ).start()
+
+    def on_update(self, change=None):
+        import copy
+
+        if change is None:
+            return  # nothing is updated in place here
+        with self.updating, self.lock:
+            hosts = [copy.copy(h) for h in self.hosts]
+            change(hosts)
+            self.hosts = hosts
+        if self._settings_changed():
+            self.on_restart()
+
+    def _settings_changed(self):
+        from .config import ConfigError, _load_documents
+
+        try:
+            settings = _load_documents(self.path, quiet=True)[0]
+        except ConfigError:
+            return False
+        return settings != self.settings
+
+    def copy(self):
+        with self.lock:
+            return list(self.hosts)
+
+
+def restart():
+    """Settings apply to everything the daemon holds: start over."""
+    print("Settings changed, restarting", flush=True)
+    os.execv(sys.executable, [sys.executable, "-m", "ssh_connect", "--daemon", "run"])
+
+
+def _alive():
+    return _request({"op": "ping"}, timeout=0.5).startswith(MAGIC)
+
+
+def serve():
+    """Run the daemon in the foreground until --daemon stop or Ctrl-C."""
+    import socketserver
+    import threading
+    from .history import History, HISTORY_FILE
+
+    path = socket_path()
+    if _alive():
+        print(f"ERROR: A daemon is already running on {path}")
+        sys.exit(1)
+    try:
+        os.unlink(path)  # left behind by a daemon that died
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    inventories = {}
+    lock = threading.Lock()
+    restarting = threading.Event()
+    started = time.time()
+    history = {"state": None, "entries": {}}
+    history_files = [cache_path(HISTORY_FILE), cache_path(HISTORY_FILE) + "-wal"]
+
+    def history_entries():
+        # Sessions are recorded by the CLI; reread only when the db changed
+        state = []
+        for f in history_files:
+            try:
+                st = os.stat(f)
+                state.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                state.append(None)
+        if state != history["state"]:
+            history["state"], history["entries"] = state, History().entries
+        return history["entries"]
+
+    def hosts_reply(config):
+        with lock:
+            inventory = inventories.get(config)
+            if inventory is None or inventory.failed:
+                # Load it for next time; this caller loads in-process
+                inventories[config] = Inventory(config, request_restart)
+                return None
+        if not inventory.ready:
+            return None
+        return inventory.settings, inventory.copy(), history_entries()
+
+    def status_reply():
+        with lock:
+            configs = {
+                path: {"ready": inv.ready, "failed": inv.failed, "hosts": len(inv.hosts)}
+                for path, inv in inventories.items()
+            }
+        return {"pid": os.getpid(), "uptime": time.time() - started, "configs": configs}
+
+    def request_restart():
+        # Exec'd from the main thread once the server has stopped
+        restarting.set()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                message = json.loads(self.rfile.readline())
+            except ValueError:
+                return
+            op = message.get("op")
+            if op == "hosts":
+                payload = hosts_reply(str(message.get("config")))
+            elif op == "status":
+                payload = status_reply()
+            else:
+                payload = None
+            self.wfile.write(MAGIC + pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+            self.wfile.flush()
+            if op == "stop":
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    old_umask = os.umask(0o077)  # socket only for this user
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    print(f"Serving on {path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    if restarting.is_set():
+        restart()
+
+
+def run_daemon_command(action):
+    if action == "run":
+        return serve()
+
+    reply = _request({"op": action})
+    if not reply.startswith(MAGIC):
+        print("No daemon running.")
+        return
+    if action == "stop":
+        print("Daemon stopped.")
+        return
+
+    status = pickle.loads(reply[len(MAGIC):])
+    print(f"Daemon running (pid {status['pid']}, up {status['uptime'] / 60:.0f} min) on {socket_path()}")
+    for path, info in status["configs"].items():
+        state = "failed" if info["failed"] else "ready" if info["ready"] else "loading"
+        print(f"  {path:<40} {state:<8} {info['hosts']} hosts")
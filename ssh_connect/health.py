@@ -0,0 +1,160 @@
+import socket
+import subprocess
+import threading
+import time
+
+from .jump import forward_check, jump_options, open_master
+from .pool import run_jobs
+
+UP = "up"
+DOWN = "down"
+NEEDS_KEY = "needs-key"
+ERROR = "error"
+PENDING = ""  # being checked; Host.status None means no check at all
+
+NEED_KEY_HINTS = ["permission denied", "publickey", "password:"]
+UNREACHABLE_HINTS = ["timed out", "connection refused", "no route", "could not resolve"]
+
+
+def classify_probe(returncode, stderr):
+    """Map the result of `ssh -o BatchMode=yes ... true` to a status."""
+    stderr = stderr.lower()
+    if any(x in stderr for x in UNREACHABLE_HINTS):
+        return DOWN
+    if any(x in stderr for x in NEED_KEY_HINTS):
+        return NEEDS_KEY
+    return UP if returncode == 0 else ERROR
+
+
+def tcp_latency(host, port, timeout):
+    """Seconds it takes to open a TCP connection; raises OSError on failure."""
+    start = time.monotonic()
+    with socket.create_connection((host, port), timeout=timeout):
+        return time.monotonic() - start
+
+
+def auth_probe(con, timeout, jump=()):
+    try:
+        check = subprocess.run(
+            ["ssh", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={max(1, round(timeout))}", *jump,
+             f"{con.user}@{con.resolved_ip}", "-p", str(con.port), "true"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout * 2,
+        )
+    except subprocess.TimeoutExpired:
+        return DOWN
+    return classify_probe(check.returncode, check.stderr)
+
+
+def check_host(con, settings, auth=False):
+    """Return (status, latency in ms or None) for one connection."""
+    if con.proxy_jump:
+        return _check_jumped(con, settings, auth)
+    try:
+        latency = tcp_latency(con.resolved_ip, con.port, settings.check_timeout)
+    except OSError:
+        return DOWN, None
+
+    status = UP
+    if auth and not con.password:
+        status = auth_probe(con, settings.check_timeout)
+    return status, latency * 1000
+
+
+def _check_jumped(con, settings, auth):
+    # Connected to from the bastion, over its shared master
+    returncode, stderr, took = forward_check(con, settings.check_timeout)
+    if returncode != 0:
+        return classify_probe(returncode, stderr), None
+
+    status = UP
+    if auth and not con.password:
+        status = auth_probe(con, settings.check_timeout, jump_options(con, settings))
+    return status, took * 1000
+
+
+def _open_jumps(hosts, settings):
+    """{proxy_jump: status} of the jump paths that can't be used, each opened once."""
+    paths = list(dict.fromkeys(con.proxy_jump for con in hosts if con.proxy_jump))
+    broken = {}
+
+    def open_path(spec):
+        error = open_master(spec, settings)
+        if error is not None:
+            status = classify_probe(255, error)
+            # The hosts behind it may be fine; they just can't be checked
+            broken[spec] = DOWN if status == DOWN else ERROR
+
+    done = run_jobs(open_path, paths, settings.check_workers, timeout=settings.check_timeout * 2 + 2)
+    for spec in paths:
+        if spec not in done:
+            broken.setdefault(spec, DOWN)
+    return broken
+
+
+def check_all(connections, settings, auth=False, on_result=None):
+    """
+    Check all connections concurrently (check_workers at a time) and store
+    the result as con.status / con.latency. Hosts that blow their
+    deadline count as down. on_result(con) is called as each one finishes.
+
+    Jump hosts are connected to first, once each: the hosts behind one that
+    is down are marked down right away, the others are checked from it.
+    """
+    hosts = list(connections)
+
+    broken = _open_jumps(hosts, settings)
+    if broken:
+        for con in hosts:
+            if con.proxy_jump in broken:
+                con.status, con.latency = broken[con.proxy_jump], None
+                if on_result:
+                    on_result(con)
+        hosts = [con for con in hosts if con.proxy_jump not in broken]
+
+    def check(i):
+        con = hosts[i]
+        con.status, con.latency = check_host(con, settings, auth)
+        if on_result:
+            on_result(con)
+
+    # TCP connect + optional ssh probe (which may take twice its timeout)
+    deadline = settings.check_timeout * (3 if auth else 1) + 1
+    done = run_jobs(check, range(len(hosts)), settings.check_workers, timeout=deadline)
+
+    for i, con in enumerate(hosts):
+        if i not in done:
+            con.status, con.latency = DOWN, None
+            if on_result:
+                on_result(con)
+
+
+def check_in_background(connections, settings, on_update):
+    # Copied on the caller's thread: the selector re-sorts the original in
+    # place, and mid-sort it looks empty to other threads
+    thread = threading.Thread(
+        target=check_all,
+        args=(list(connections), settings),
+        kwargs={"on_result": lambda con: on_update()},
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def print_status_table(connections, settings, auth=False):
+    start = time.monotonic()
+    check_all(connections, settings, auth)
+    elapsed = time.monotonic() - start
+
+    counts = {}
+    for i, c in enumerate(connections, 1):
+        latency = f"{c.latency:.1f} ms" if c.latency is not None else "-"
+        print(f"{i:<3} {c.resolved_name:<25} {c.resolved_ip:<18} {c.status:<10} {latency:>10}")
+        counts[c.status] = counts.get(c.status, 0) + 1
+
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+    print(f"\n{len(connections)} hosts checked in {elapsed:.1f}s: {summary}")
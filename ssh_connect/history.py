@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import time
+
+from .utils import cache_path
+
+HISTORY_FILE = "ssh_connect_history.sqlite3"
+
+# A connection's weight in the frecency score halves every two weeks
+HALF_LIFE = 14 * 86400
+# Failed connections still count, but much less than successful ones
+FAILED_WEIGHT = 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY,
+    host_key    TEXT NOT NULL,
+    started     REAL NOT NULL,
+    duration    REAL NOT NULL,
+    exit_status INTEGER,
+    ok          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_host ON events (host_key, started);
+CREATE TABLE IF NOT EXISTS hosts (
+    host_key    TEXT PRIMARY KEY,
+    last_used   REAL NOT NULL,
+    count       INTEGER NOT NULL,
+    score       REAL NOT NULL,
+    score_time  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    host_key    TEXT NOT NULL,
+    started     REAL NOT NULL,
+    probe       REAL,
+    handshake   REAL,
+    key_upload  REAL,
+    duration    REAL NOT NULL,
+    exit_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS metrics_time ON metrics (started);
+"""
+
+# Phases start_session can time (seconds), stored per connection in metrics
+PHASES = ("probe", "handshake", "key_upload")
+
+
+def decayed(score, score_time, now):
+    return score * 0.5 ** ((now - score_time) / HALF_LIFE)
+
+
+class History:
+    """
+    Connection history in a small SQLite database.
+
+    `events` is append-only (one row per connection); `hosts` is a summary
+    per Host.key (last use, count, frecency score) updated in the same
+    transaction, so reading it on startup is one small query. `metrics`
+    holds per-phase timings when session_metrics is on, and only for the
+    last metrics_days (older rows are dropped as new ones come in). SQLite's
+    locking plus BEGIN IMMEDIATE keep concurrent ssh_connect processes from
+    losing each other's writes.
+    """
+
+    def __init__(self, path=None, entries=None):
+        self.path = path or cache_path(HISTORY_FILE)
+        self.entries = {}   # host_key -> (last_used, count, score, score_time)
+        if entries is not None:
+            self.entries = dict(entries)  # already read, e.g. by the daemon
+            return
+        try:
+            db = self._connect()
+            try:
+                rows = db.execute(
+                    "SELECT host_key, last_used, count, score, score_time FROM hosts"
+                ).fetchall()
+            finally:
+                db.close()
+            self.entries = {key: tuple(rest) for key, *rest in rows}
+        except (sqlite3.Error, OSError):
+            pass  # unreadable history: start empty, writes will retry
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        return db
+
+    def frecency(self, key, now=None):
+        entry = self.entries.get(key)
+        if not entry:
+            return 0.0
+        return decayed(entry[2], entry[3], now or time.time())
+
+    def top(self, hosts, n):
+        """The n hosts with the highest frecency (only ones used before)."""
+        now = time.time()
+        scored = [(self.frecency(h.key, now), i) for i, h in enumerate(hosts)]
+        scored = [s for s in scored if s[0] > 0]
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [hosts[i] for _, i in scored[:n]]
+
+    def record(self, key, started, duration, exit_status, ok, timings=None, keep_days=90):
+        """Add a connection; `timings` ({phase: seconds}) also go to metrics."""
+        weight = 1.0 if ok else FAILED_WEIGHT
+        try:
+            db = self._connect()
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute(
+                    "INSERT INTO events (host_key, started, duration, exit_status, ok)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, started, duration, exit_status, int(ok)),
+                )
+                row = db.execute(
+                    "SELECT count, score, score_time FROM hosts WHERE host_key = ?", (key,)
+                ).fetchone()
+                count, score = (row[0], decayed(row[1], row[2], started)) if row else (0, 0.0)
+                db.execute(
+                    "INSERT OR REPLACE INTO hosts (host_key, last_used, count, score, score_time)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, started, count + 1, score + weight, started),
+                )
+                if timings is not None:
+                    db.execute(
+                        "INSERT INTO metrics (host_key, started, probe, handshake, key_upload,"
+                        " duration, exit_status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, started, *(timings.get(p) for p in PHASES), duration, exit_status),
+                    )
+                    db.execute("DELETE FROM metrics WHERE started < ?", (time.time() - keep_days * 86400,))
+                db.execute("COMMIT")
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError):
+            return  # history is best effort; never fail a session over it
+
+        self.entries[key] = (started, count + 1, score + weight, started)
+
+    def _query(self, sql, args=()):
+        try:
+            db = self._connect()
+            try:
+                return db.execute(sql, args).fetchall()
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError):
+            return []
+
+    def metrics(self):
+        """[(host_key, started, probe, handshake, key_upload, duration, exit_status)], oldest first."""
+        return self._query(
+            "SELECT host_key, started, probe, handshake, key_upload, duration, exit_status"
+            " FROM metrics ORDER BY started"
+        )
+
+    def latencies(self):
+        """{host_key: average connect latency in seconds} (handshake, else probe)."""
+        return dict(self._query(
+            "SELECT host_key, AVG(COALESCE(handshake, probe)) FROM metrics"
+            " WHERE COALESCE(handshake, probe) IS NOT NULL GROUP BY host_key"
+        ))
@@ -0,0 +1,131 @@
+import os
+import ipaddress
+
+from .search import SEPARATOR
+
+
+DEFAULT_USER = os.getenv("LOGNAME")
+
+# Every char of an IP literal is one of these (scoped IPv6 aside), so most
+# host names are rejected without the much slower ipaddress parse
+IP_CHARS = frozenset("0123456789abcdefABCDEF.:")
+
+
+def _maybe_ip(s):
+    return IP_CHARS.issuperset(s) or "%" in s
+
+
+def is_ip(s: str):
+    if not _maybe_ip(s):
+        return False
+    try:
+        ipaddress.ip_address(s)
+    except ValueError:
+        return False
+    return True
+
+
+def ip_sort(ip: str, tiebreak=""):
+    """
+    Sort key: IPv4 before IPv6, numerically; then unresolved names
+    alphabetically, with `tiebreak` keeping equal keys in a stable order.
+    """
+    try:
+        if not _maybe_ip(ip):
+            raise ValueError(ip)
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return (1, 0, 0, ip.lower(), tiebreak)
+    return (0, addr.version, int(addr), "", tiebreak)
+
+
+class Host:
+    """
+    One connection from the config, validated once at load time.
+
+    Everything the UI and the session need per render or connect is a plain
+    attribute; derived keys are recomputed only when the resolved name/IP
+    change (see set_resolved).
+    """
+
+    __slots__ = (
+        "host", "name", "user", "port", "password", "skip_key_setup", "group", "tags",
+        "key", "resolved_name", "resolved_ip", "sort_key", "name_key", "search_key",
+        "status", "latency", "source", "proxy_jump",
+    )
+
+    def __init__(self, host, name=None, user=None, port=22, password=None,
+                 skip_key_setup=False, group=None, tags=(), proxy_jump=None):
+        self.host = host
+        self.name = name                  # configured display name, if any
+        self.user = user or DEFAULT_USER
+        self.port = port
+        self.password = password
+        self.skip_key_setup = skip_key_setup  # effective: per-host or global
+        self.group = group
+        self.tags = tuple(tags)
+        self.proxy_jump = proxy_jump      # ProxyJump spec, None = direct
+        self.key = self._identity()
+        self.status = None                # reachability, None = not checked
+        self.latency = None
+        self.source = None                # inventory source, None = config files
+        self.set_resolved(name or host, host)
+
+    @classmethod
+    def from_entry(cls, entry, settings):
+        """Build a Host from a raw YAML mapping; raises ValueError if invalid."""
+        if not isinstance(entry, dict):
+            raise ValueError(f"expected a mapping, got {entry!r}")
+        host = entry.get("host")
+        if not host:
+            raise ValueError("missing 'host'")
+        try:
+            port = int(entry.get("port", 22))
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid port {entry.get('port')!r}")
+
+        name = entry.get("name")
+        group = entry.get("group")
+        # "none", as in ssh_config, overrides a group's jump host
+        jump = entry.get("proxy_jump")
+        if jump is not None and not isinstance(jump, str):
+            raise ValueError(f"invalid proxy_jump {jump!r}")
+        if jump and jump.strip().lower() == "none":
+            jump = None
+        tags = entry.get("tags") or ()
+        if isinstance(tags, str):
+            tags = (tags,)
+        return cls(
+            host=str(host),
+            name=str(name) if name else None,
+            user=entry.get("user"),
+            port=port,
+            password=entry.get("password"),
+            skip_key_setup=bool(entry.get("skip_key_setup", settings.skip_key_setup)),
+            group=str(group) if group else None,
+            tags=tuple(dict.fromkeys(str(t) for t in tags)),
+            proxy_jump=jump.strip() if jump else None,
+        )
+
+    def _identity(self):
+        # Stable across config edits and re-sorting. The same address behind
+        # another jump host is another machine.
+        key = f"{self.user}@{self.host}:{self.port}"
+        return f"{key} via {self.proxy_jump}" if self.proxy_jump else key
+
+    def set_proxy_jump(self, spec):
+        self.proxy_jump = spec
+        self.key = self._identity()
+        self.set_resolved(self.resolved_name, self.resolved_ip)
+
+    def set_resolved(self, name, ip):
+        self.resolved_name = name
+        self.resolved_ip = ip
+        self.sort_key = ip_sort(ip, self.key)
+        self.name_key = (name.lower(), self.key)
+        self.search_key = SEPARATOR.join(
+            (name, ip, self.host, self.user or "", self.group or "", *self.tags)
+        ).lower()
+
+    def __repr__(self):
+        return f"Host({self.host!r}, resolved={self.resolved_name!r}/{self.resolved_ip!r})"
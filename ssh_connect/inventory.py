@@ -0,0 +1,154 @@
+import importlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+
+from .pool import run_jobs
+from .utils import cache_path, atomic_write
+
+SOURCE_DEFAULTS = {"ttl": 3600, "timeout": 30, "group": None}
+
+
+def source_specs(settings):
+    """The `sources` setting, validated, with defaults filled in."""
+    specs = []
+    for n, raw in enumerate(settings.sources or [], 1):
+        if not isinstance(raw, dict) or not raw.get("name"):
+            print(f"ERROR: Source #{n} needs a 'name'")
+            sys.exit(1)
+        if bool(raw.get("command")) == bool(raw.get("entry_point")):
+            print(f"ERROR: Source {raw['name']!r} needs either 'command' or 'entry_point'")
+            sys.exit(1)
+        specs.append({**SOURCE_DEFAULTS, **raw, "name": str(raw["name"])})
+    return specs
+
+
+def _cache_file(spec):
+    name = re.sub(r"[^\w.-]", "_", spec["name"])
+    return cache_path(f"ssh_connect_source_{name}.json")
+
+
+def read_cache(spec):
+    """(fetch time, host records) from the last successful fetch, or (None, None)."""
+    try:
+        with open(_cache_file(spec)) as f:
+            data = json.load(f)
+        if data.get("version") == 1:
+            return data["fetched"], data["hosts"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None, None
+
+
+def stale_specs(specs, fetched=None):
+    """Specs whose cache is missing or older than their ttl."""
+    now = time.time()
+    if fetched is None:
+        fetched = {spec["name"]: read_cache(spec)[0] for spec in specs}
+    return [
+        spec for spec in specs
+        if fetched[spec["name"]] is None or now - fetched[spec["name"]] > spec["ttl"]
+    ]
+
+
+def _records(data, name):
+    if isinstance(data, dict):
+        data = data.get("hosts")
+    if not isinstance(data, list):
+        raise ValueError(f"source {name!r} did not return a list of hosts")
+    return data
+
+
+def fetch(spec):
+    """
+    Run one source and return its host records (raises on failure).
+
+    A `command` must print JSON, either a list of host mappings or
+    {"hosts": [...]}; an `entry_point` ("module:function") returns the same
+    as Python objects.
+    """
+    if spec.get("command"):
+        command = spec["command"]
+        argv = shlex.split(os.path.expanduser(command)) if isinstance(command, str) else command
+        out = subprocess.run(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=spec["timeout"],
+            check=True,
+        ).stdout
+        data = json.loads(out)
+    else:
+        module, _, attr = spec["entry_point"].partition(":")
+        data = getattr(importlib.import_module(module), attr)()
+    return _records(data, spec["name"])
+
+
+def fetch_all(specs, errors=None):
+    """
+    Fetch all `specs` in parallel, cache what succeeded and return
+    {name: host records}. Failed or timed out sources are left out; with
+    an `errors` dict, why is stored in it per name.
+    """
+    def job(name):
+        spec = by_name[name]
+        try:
+            hosts = fetch(spec)
+        except Exception as e:
+            failures[name] = e
+            raise
+        atomic_write(
+            _cache_file(spec),
+            json.dumps({"version": 1, "fetched": time.time(), "hosts": hosts}),
+        )
+        return hosts
+
+    by_name = {spec["name"]: spec for spec in specs}
+    failures = {}
+    timeout = max((spec["timeout"] for spec in specs), default=None)
+    found = run_jobs(job, list(by_name), len(by_name), timeout=timeout)
+    if errors is not None:
+        for name in by_name:
+            if name not in found:
+                errors[name] = failures.get(name) or f"timed out after {by_name[name]['timeout']}s"
+    return found
+
+
+def documents(specs, records):
+    """Host documents (as from a config fragment) per source, for _build_hosts."""
+    return [
+        (f"source {spec['name']}", {
+            "hosts": records[spec["name"]],
+            "group": spec["group"],
+            "source": spec["name"],
+        })
+        for spec in specs
+        if records.get(spec["name"]) is not None
+    ]
+
+
+def cached_documents(settings, refresh_stale=False):
+    """
+    Documents of all sources from their cache. With refresh_stale, sources
+    with a missing or expired cache are fetched first (in parallel); if
+    that fails the old cache, if any, is used.
+    """
+    specs = source_specs(settings)
+    fetched, records = {}, {}
+    for spec in specs:
+        fetched[spec["name"]], records[spec["name"]] = read_cache(spec)
+    if refresh_stale:
+        errors = {}
+        records.update(fetch_all(stale_specs(specs, fetched), errors))
+        # Not shown in the selector (it doesn't refresh here), but a
+        # scripted call would otherwise just miss the hosts
+        for name, error in errors.items():
+            fallback = "using the cached hosts" if records[name] is not None else "no hosts from it"
+            print(f"WARNING: Source {name!r} failed ({fallback}): {error}", file=sys.stderr)
+    return documents(specs, records)
@@ -0,0 +1,190 @@
+import functools
+import os
+import shlex
+import subprocess
+import threading
+import time
+
+from .host import DEFAULT_USER
+from .mux import check_master, control_dir, jump_tag
+
+# A master found alive is trusted this long (s) before it is checked again
+RECHECK = 30
+
+_lock = threading.Lock()
+_locks = {}     # control socket -> Lock, so one master is started per bastion
+_checked = {}   # control socket -> time.monotonic() it was last seen alive
+
+
+def parse_hop(hop):
+    """(user or None, host, port or None) of a "[user@]host[:port]" jump hop."""
+    user, _, rest = hop.strip().rpartition("@")
+    if rest.startswith("["):
+        host, _, port = rest[1:].partition("]")
+        port = port.lstrip(":")
+    elif rest.count(":") == 1:
+        host, port = rest.split(":")
+    else:
+        host, port = rest, ""  # a bare IPv6 address has no port
+    if not host:
+        raise ValueError(f"invalid jump host {hop!r}")
+    try:
+        return user or None, host, int(port) if port else None
+    except ValueError:
+        raise ValueError(f"invalid port in jump host {hop!r}")
+
+
+def format_hop(user, host, port):
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    return f"{user + '@' if user else ''}{host}{':' + str(port) if port else ''}"
+
+
+def bastion(spec):
+    """(the hops before the last one as a ProxyJump spec or None, the last hop) of `spec`."""
+    hops = [h.strip() for h in spec.split(",") if h.strip()]
+    return ",".join(hops[:-1]) or None, hops[-1]
+
+
+@functools.lru_cache(maxsize=None)
+def _destination(hop):
+    """(user, host, port) ssh connects to for `hop`, after ~/.ssh/config."""
+    user, host, port = parse_hop(hop)
+    try:
+        out = subprocess.run(
+            ["ssh", "-G", *_target(hop)],
+            stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=5,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        out = ""
+    options = dict(line.split(" ", 1) for line in out.splitlines() if " " in line)
+    try:
+        port = int(options.get("port", port or 22))
+    except ValueError:
+        port = port or 22
+    return options.get("user", user or DEFAULT_USER), options.get("hostname", host), port
+
+
+def master_path(upstream, hop):
+    """Control socket of the shared master to `hop` via `upstream`, named like mux_options' sockets."""
+    user, host, port = _destination(hop)
+    return os.path.join(control_dir(), f"{user}@{host}:{port}{jump_tag(upstream)}")
+
+
+def _target(hop):
+    # Without a port of its own, the hop's Port from ~/.ssh/config applies
+    user, host, port = parse_hop(hop)
+    return [f"{user}@{host}" if user else host, *(["-p", str(port)] if port else [])]
+
+
+def open_master(spec, settings, batch=True):
+    """
+    Make sure a master connection to the last hop of `spec` is up (reached
+    through the hops before it), starting one if needed. Returns None once
+    it is, else ssh's error output. With batch, ssh never prompts.
+    """
+    import tempfile
+
+    upstream, hop = bastion(spec)
+    path = master_path(upstream, hop)
+    with _lock:
+        lock = _locks.setdefault(path, threading.Lock())
+    with lock:
+        if time.monotonic() - _checked.get(path, -RECHECK) < RECHECK:
+            return None
+        if os.path.exists(path) and check_master(path, os.path.basename(path)):
+            _checked[path] = time.monotonic()
+            return None
+        try:
+            os.unlink(path)  # left behind by a master that died
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+
+        argv = [
+            "ssh", "-f", "-N",
+            "-o", "ControlMaster=yes",
+            "-o", f"ControlPath={path}",
+            "-o", f"ControlPersist={settings.control_persist}",
+        ]
+        if batch:
+            argv += ["-o", "BatchMode=yes",
+                     "-o", f"ConnectTimeout={max(1, round(settings.check_timeout))}"]
+        if upstream:
+            # Further jump hosts are shared the same way
+            if open_master(upstream, settings, batch) is None:
+                argv += ["-o", f"ProxyCommand={proxy_command(upstream, batch)}"]
+            else:
+                argv += ["-J", upstream]
+        # A file, not a pipe: the backgrounded master keeps stderr open
+        with tempfile.TemporaryFile("w+") as stderr:
+            try:
+                result = subprocess.run(
+                    argv + _target(hop),
+                    stdin=subprocess.DEVNULL if batch else None,
+                    stderr=stderr,
+                    timeout=settings.check_timeout * 2 + 1 if batch else None,
+                )
+            except subprocess.TimeoutExpired:
+                return "connection timed out"
+            stderr.seek(0)
+            error = stderr.read()
+        if result.returncode != 0:
+            if not batch:
+                print(error, end="")
+            return error or f"ssh exited with {result.returncode}"
+        _checked[path] = time.monotonic()
+        return None
+
+
+def proxy_command(spec, batch=True):
+    """ProxyCommand reaching %h:%p through the shared master to the last hop of `spec`."""
+    upstream, hop = bastion(spec)
+    # Without a live master, this ssh connects to the bastion on its own
+    argv = ["ssh", "-o", "ControlMaster=no", "-S", master_path(upstream, hop), "-W", "%h:%p"]
+    if batch:
+        argv[1:1] = ["-o", "BatchMode=yes"]
+    if upstream:
+        argv += ["-J", upstream]
+    return shlex.join(argv + _target(hop))
+
+
+def jump_options(con, settings, batch=True):
+    """
+    ssh -o options reaching `con` through its jump hosts (none without
+    proxy_jump). The connection to the bastion is made once and shared by
+    every probe, session and parallel run to the hosts behind it; if it
+    can't be made, ssh jumps on its own and reports why.
+    """
+    if not con.proxy_jump:
+        return []
+    if open_master(con.proxy_jump, settings, batch) is None:
+        return ["-o", f"ProxyCommand={proxy_command(con.proxy_jump, batch)}"]
+    return ["-o", f"ProxyJump={con.proxy_jump}"]
+
+
+def forward_check(con, timeout):
+    """
+    Open a connection to con's ssh port through its bastion's master, as a
+    TCP check from the bastion. Returns (returncode, stderr, seconds).
+    """
+    start = time.monotonic()
+    upstream, hop = bastion(con.proxy_jump)
+    host = f"[{con.resolved_ip}]" if ":" in con.resolved_ip else con.resolved_ip
+    argv = ["ssh", "-o", "BatchMode=yes", "-o", "ControlMaster=no",
+            "-S", master_path(upstream, hop), "-W", f"{host}:{con.port}"]
+    # Without a live master, this ssh connects to the bastion on its own
+    if upstream:
+        argv += ["-J", upstream]
+    try:
+        check = subprocess.run(
+            argv + _target(hop),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return 255, "connection timed out", None
+    return check.returncode, check.stderr, time.monotonic() - start
@@ -0,0 +1,195 @@
+import fnmatch
+import json
+import os
+import re
+import sys
+import threading
+
+from .search import fuzzy_positions
+
+FORMATS = ("table", "json", "jsonl", "csv", "tsv")
+
+# Field -> column width in the table format
+FIELDS = {
+    "index": 3,
+    "name": 25,
+    "ip": 18,
+    "host": 30,
+    "user": 12,
+    "port": 5,
+    "group": 15,
+    "tags": 20,
+    "status": 10,
+    "latency": 10,
+    "last_used": 19,
+    "source": 12,
+    "proxy_jump": 30,
+}
+DEFAULT_FIELDS = {
+    "table": ["index", "name", "ip"],
+    "machine": ["name", "ip", "host", "user", "port"],
+}
+
+# "field=glob", "field!=glob", "field~regex", "field<number", ...
+CONDITION = re.compile(r"^\s*([\w-]+)\s*(!=|<=|>=|=|~|<|>)\s*(.*?)\s*$")
+
+
+def _field_name(name):
+    name = name.strip().lower().replace("-", "_")
+    if name not in FIELDS:
+        print(f"ERROR: Unknown field {name!r} (available: {', '.join(FIELDS)})")
+        sys.exit(1)
+    return name
+
+
+def parse_fields(spec, fmt):
+    if not spec:
+        return list(DEFAULT_FIELDS["table" if fmt == "table" else "machine"])
+    return [_field_name(f) for f in spec.split(",") if f.strip()]
+
+
+def value(con, field, history, index=None):
+    """One field of a host, as plain Python data (None when unknown)."""
+    if field == "index":
+        return index
+    if field == "name":
+        return con.resolved_name
+    if field == "ip":
+        return con.resolved_ip
+    if field == "tags":
+        return list(con.tags)
+    if field == "latency":
+        return round(con.latency, 1) if con.latency is not None else None
+    if field == "last_used":
+        from datetime import datetime
+
+        entry = history.entries.get(con.key)
+        return datetime.fromtimestamp(entry[0]).isoformat(timespec="seconds") if entry else None
+    return getattr(con, field)
+
+
+def _condition(expr):
+    m = CONDITION.match(expr)
+    if not m:
+        print(f"ERROR: Invalid filter {expr!r}, expected e.g. user=root, port!=22, name~^web, latency<50")
+        sys.exit(1)
+    field, op, wanted = _field_name(m.group(1)), m.group(2), m.group(3)
+    if field == "index":
+        print("ERROR: Filters can't use index; use --hosts for ranges")
+        sys.exit(1)
+
+    if op in ("=", "!="):
+        pattern = wanted.lower()
+
+        def test(v):
+            # Tags match if any of them does
+            values = v if isinstance(v, list) else [v]
+            return any(fnmatch.fnmatchcase(str(x).lower(), pattern) for x in values if x is not None)
+        return field, (test if op == "=" else lambda v: not test(v))
+
+    if op == "~":
+        try:
+            regex = re.compile(wanted, re.IGNORECASE)
+        except re.error as e:
+            print(f"ERROR: Invalid regex in {expr!r}: {e}")
+            sys.exit(1)
+        return field, lambda v: any(
+            regex.search(str(x)) for x in (v if isinstance(v, list) else [v]) if x is not None
+        )
+
+    try:
+        number = float(wanted)
+    except ValueError:
+        print(f"ERROR: {op} needs a number in {expr!r}")
+        sys.exit(1)
+    compare = {
+        "<": lambda a: a < number, "<=": lambda a: a <= number,
+        ">": lambda a: a > number, ">=": lambda a: a >= number,
+    }[op]
+
+    def numeric(v):
+        try:
+            return v is not None and compare(float(v))
+        except (TypeError, ValueError):
+            return False
+    return field, numeric
+
+
+def host_filter(conditions, query, history):
+    """Predicate for hosts matching all `conditions` (--where) and the fuzzy `query`."""
+    tests = [_condition(expr) for expr in conditions or ()]
+    query = (query or "").lower()
+
+    def matches(con):
+        if query and fuzzy_positions(query, con.search_key) is None:
+            return False
+        return all(test(value(con, field, history)) for field, test in tests)
+    return matches
+
+
+class Writer:
+    """
+    Writes hosts as rows in one of FORMATS, flushing after each row so a
+    consumer sees them as they come. Thread-safe: rows may be written from
+    the resolver's worker threads.
+    """
+
+    def __init__(self, fmt, fields, history, out=None):
+        self.fmt = fmt
+        self.fields = fields
+        self.history = history
+        self.out = out or sys.stdout
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.csv = None
+        if fmt in ("csv", "tsv"):
+            import csv
+
+            self.csv = csv.writer(self.out, delimiter="," if fmt == "csv" else "\t",
+                                  lineterminator="\n")
+            self.csv.writerow(fields)
+        elif fmt == "json":
+            self.out.write("[")
+
+    def _text(self, v):
+        if v is None:
+            return ""
+        if isinstance(v, list):
+            return ",".join(v)
+        return str(v)
+
+    def write(self, con, index=None):
+        record = {f: value(con, f, self.history, index) for f in self.fields}
+        with self.lock:
+            try:
+                self._write(record)
+            except BrokenPipeError:
+                self._closed_pipe()
+
+    def _write(self, record):
+        if self.fmt == "table":
+            cells = [self._text(v) for v in record.values()]
+            # Pad all but the last column
+            line = " ".join(c.ljust(FIELDS[f]) for c, f in zip(cells[:-1], self.fields))
+            self.out.write(f"{line} {cells[-1]}\n" if line else f"{cells[-1]}\n")
+        elif self.csv:
+            self.csv.writerow([self._text(v) for v in record.values()])
+        elif self.fmt == "json":
+            self.out.write(("," if self.rows else "") + "\n  " + json.dumps(record))
+        else:
+            self.out.write(json.dumps(record) + "\n")
+        self.rows += 1
+        self.out.flush()
+
+    def _closed_pipe(self):
+        # The reader went away (e.g. `| head`): drop the rest quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, self.out.fileno())
+
+    def close(self):
+        try:
+            if self.fmt == "json":
+                self.out.write("\n]\n" if self.rows else "]\n")
+            self.out.flush()
+        except BrokenPipeError:
+            self._closed_pipe()
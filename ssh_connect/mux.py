@@ -0,0 +1,92 @@
+import os
+import subprocess
+
+from .utils import cache_path
+
+CONTROL_DIR = "ssh_connect_cm"
+
+
+def control_dir():
+    return cache_path(CONTROL_DIR)
+
+
+def jump_tag(spec):
+    """Suffix of control sockets for connections made through the jump hosts `spec`."""
+    import hashlib
+
+    return "~" + hashlib.sha1(spec.encode()).hexdigest()[:10] if spec else ""
+
+
+def mux_options(settings, con=None):
+    """
+    ssh -o options that share one master connection per user@host:port
+    (and jump path, for `con` behind jump hosts).
+
+    The first ssh to a host (usually the pre-flight probe) becomes the
+    master and stays alive for `control_persist`; the session, ssh-copy-id
+    and later runs reuse it without a new handshake.
+    """
+    if not settings.multiplex:
+        return []
+
+    path = control_dir()
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return [
+        "-o", "ControlMaster=auto",
+        "-o", f"ControlPath={path}/%r@%h:%p{jump_tag(con.proxy_jump if con else None)}",
+        "-o", f"ControlPersist={settings.control_persist}",
+    ]
+
+
+def list_masters():
+    """Return [(target, socket_path)] for every control socket on disk."""
+    path = control_dir()
+    if not os.path.isdir(path):
+        return []
+    return [
+        (name, os.path.join(path, name))
+        for name in sorted(os.listdir(path))
+        if "@" in name and ":" in name
+    ]
+
+
+def _control(socket_path, target, command):
+    user_host, port = target.rsplit(":", 1)
+    port = port.split("~")[0]  # jump_tag
+    return subprocess.run(
+        ["ssh", "-S", socket_path, "-O", command, "-p", port, user_host],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ).returncode == 0
+
+
+def check_master(socket_path, target):
+    return _control(socket_path, target, "check")
+
+
+def stop_master(socket_path, target):
+    return _control(socket_path, target, "exit")
+
+
+def run_mux_command(action):
+    masters = list_masters()
+    if not masters:
+        print("No master connections.")
+        return
+
+    for target, socket_path in masters:
+        if action == "list":
+            print(target)
+        elif action == "check":
+            alive = check_master(socket_path, target)
+            if not alive:
+                # Left behind by a master that died without cleaning up
+                try:
+                    os.unlink(socket_path)
+                except OSError:
+                    pass
+            print(f"{target:<40} {'alive' if alive else 'stale (removed)'}")
+        elif action == "stop":
+            stopped = stop_master(socket_path, target)
+            print(f"{target:<40} {'stopped' if stopped else 'not running'}")
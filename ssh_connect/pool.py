@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+
+
+def run_jobs(func, items, workers, timeout=None, on_result=None):
+    """
+    Call func(item) for every item on at most `workers` threads and return
+    {item: value} for the calls that succeeded.
+
+    A call that raises, or is still running `timeout` seconds after it
+    started, is left out of the result. Its thread is abandoned (threads are
+    daemons, so a hung lookup never blocks exit) and a fresh worker takes
+    its slot, so one dead host can't stall the rest of the queue.
+
+    on_result(item, value) is called from the worker thread as soon as a
+    call succeeds.
+    """
+    items = list(dict.fromkeys(items))
+    results = {}
+    if not items:
+        return results
+
+    todo = queue.SimpleQueue()
+    for item in items:
+        todo.put(item)
+
+    cond = threading.Condition()
+    running = {}     # item -> monotonic start time
+    done = set()     # finished, failed or given up on
+
+    def worker():
+        while True:
+            try:
+                item = todo.get_nowait()
+            except queue.Empty:
+                return
+
+            with cond:
+                running[item] = time.monotonic()
+
+            try:
+                value, ok = func(item), True
+            except Exception:
+                value, ok = None, False
+
+            with cond:
+                if item in done:
+                    # Timed out meanwhile; a replacement already took our slot
+                    return
+                running.pop(item, None)
+                done.add(item)
+                if ok:
+                    results[item] = value
+                cond.notify()
+
+            if ok and on_result:
+                on_result(item, value)
+
+    def spawn():
+        threading.Thread(target=worker, daemon=True).start()
+
+    for _ in range(max(1, min(workers, len(items)))):
+        spawn()
+
+    with cond:
+        while len(done) < len(items):
+            wait = None
+            if timeout is not None and running:
+                now = time.monotonic()
+                for item, started in list(running.items()):
+                    if now - started >= timeout:
+                        del running[item]
+                        done.add(item)
+                        spawn()
+                if running:
+                    wait = max(0.0, min(running.values()) + timeout - now)
+            if len(done) < len(items):
+                cond.wait(wait if wait is not None else timeout)
+
+    return results
@@ -0,0 +1,102 @@
+import asyncio
+import subprocess
+import threading
+import time
+
+from .health import classify_probe
+from .jump import jump_options
+from .mux import mux_options
+from .session import probe_argv, list_local_pubkeys
+
+# The cursor has to rest on a host this long before it is probed
+REST = 0.25
+# A probe result is trusted this long (s) when the session starts
+MAX_AGE = 30
+# Enter waits this long (s) for a running probe before probing itself
+WAIT = 5
+
+
+async def probe(con, options):
+    """The probe as an asyncio subprocess; cancelling it kills the ssh."""
+    proc = await asyncio.create_subprocess_exec(
+        *probe_argv(con, options),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        _, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return classify_probe(proc.returncode, stderr.decode(errors="replace"))
+
+
+class Prober:
+    """
+    Probes the host under the selector's cursor before Enter is pressed.
+
+    Probes run as asyncio subprocesses on a loop of their own, so they
+    outlive the selector's app and never block its redraws. Moving on to
+    another host cancels the running probe; results are kept per Host for
+    MAX_AGE. The local public keys are listed once, in parallel.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.results = {}      # Host -> (status, time.monotonic(), seconds taken)
+        self.running = None    # (Host, concurrent.futures.Future)
+        self.pubkeys = asyncio.run_coroutine_threadsafe(
+            asyncio.to_thread(list_local_pubkeys), self.loop
+        )
+
+    def rest_on(self, con):
+        """Called with the host under the cursor (None for none) as it changes."""
+        if self.running and self.running[0] is con:
+            return
+        if self.running:
+            self.running[1].cancel()
+            self.running = None
+        # Password hosts are never probed; fresh results are reused
+        if con is None or con.password or self.cached(con) is not None:
+            return
+        self.running = (con, asyncio.run_coroutine_threadsafe(self._probe(con), self.loop))
+
+    async def _probe(self, con):
+        await asyncio.sleep(REST)
+        start = time.monotonic()
+        # Opens the shared master to con's bastion, if it has one
+        jump = await asyncio.to_thread(jump_options, con, self.settings)
+        # Reuse a master if there is one, but never leave one behind for
+        # every host the cursor passes: only the session becomes the master
+        mux = ["ControlMaster=no" if o == "ControlMaster=auto" else o
+               for o in mux_options(self.settings, con)]
+        status = await probe(con, [*mux, *jump])
+        self.results[con] = (status, time.monotonic(), time.monotonic() - start)
+        return status
+
+    def cached(self, con):
+        status, when, _ = self.results.get(con, (None, 0, None))
+        return status if time.monotonic() - when < MAX_AGE else None
+
+    def took(self, con):
+        """How long con's last probe took (s), or None."""
+        return self.results.get(con, (None, 0, None))[2]
+
+    def status(self, con):
+        """con's probe result, waiting for one still running; None if there is none."""
+        status = self.cached(con)
+        running = self.running
+        if status is None and running and running[0] is con and not running[1].done():
+            try:
+                status = running[1].result(timeout=WAIT)
+            except Exception:  # cancelled, timed out, or ssh could not be started
+                running[1].cancel()
+                return None
+        return status
+
+    def keys(self):
+        return self.pubkeys.result()
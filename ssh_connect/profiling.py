@@ -0,0 +1,126 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# When this module was imported, i.e. just before the rest of ssh_connect
+STARTED = time.perf_counter()
+
+ENABLED = False
+TRACE_FILE = None
+# Shown in the report: the hosts whose lookups took longest
+SLOWEST = 10
+
+# (name, start, duration, thread id, args)
+spans = []
+_lock = threading.Lock()
+_NOOP = nullcontext()
+
+
+def enable(trace_file=None):
+    """Start recording spans; the report is printed when the program exits."""
+    global ENABLED, TRACE_FILE
+    import atexit
+
+    ENABLED = True
+    TRACE_FILE = trace_file
+    atexit.register(report)
+
+
+def enable_from_env():
+    """SSH_CONNECT_PROFILE=1 prints the report, =<file> also writes a trace."""
+    value = os.getenv("SSH_CONNECT_PROFILE", "")
+    if value and value != "0":
+        enable(None if value == "1" else value)
+
+
+def record(name, start, end, **args):
+    """Add a span measured elsewhere (perf_counter timestamps)."""
+    if ENABLED:
+        with _lock:
+            spans.append((name, start, end - start, threading.get_ident(), args))
+
+
+@contextmanager
+def _span(name, args):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter(), **args)
+
+
+def span(name, **args):
+    """Context manager timing a stage; a shared no-op while profiling is off."""
+    if not ENABLED:
+        return _NOOP
+    return _span(name, args)
+
+
+def timed(name, func, **args):
+    """func(item) wrapped to record a span per call, with `item` among its args."""
+    if not ENABLED:
+        return func
+
+    def wrapper(item):
+        start = time.perf_counter()
+        try:
+            return func(item)
+        finally:
+            record(name, start, time.perf_counter(), item=str(item), **args)
+    return wrapper
+
+
+def report(file=None):
+    file = file or sys.stderr
+    with _lock:
+        recorded = list(spans)
+    if not recorded:
+        return
+
+    # Per stage, in order of first appearance
+    stages = {}
+    for name, _, duration, _, _ in recorded:
+        count, total, worst = stages.get(name, (0, 0.0, 0.0))
+        stages[name] = (count + 1, total + duration, max(worst, duration))
+
+    print("\nProfile (ms)", file=file)
+    print(f"  {'stage':<24} {'count':>6} {'total':>10} {'max':>10}", file=file)
+    for name, (count, total, worst) in stages.items():
+        print(f"  {name:<24} {count:>6} {total * 1000:>10.1f} {worst * 1000:>10.1f}", file=file)
+
+    lookups = sorted(
+        (s for s in recorded if s[0] == "dns.lookup"), key=lambda s: s[2], reverse=True
+    )[:SLOWEST]
+    if lookups:
+        print("\n  slowest lookups", file=file)
+        for _, _, duration, _, args in lookups:
+            print(f"  {args.get('item', ''):<36} {args.get('kind', ''):<8} {duration * 1000:>10.1f}",
+                  file=file)
+
+    if TRACE_FILE:
+        write_trace(TRACE_FILE, recorded)
+        print(f"\n  trace written to {TRACE_FILE}", file=file)
+
+
+def write_trace(path, recorded):
+    """Chrome trace format (chrome://tracing, Perfetto): one complete event per span."""
+    import json
+
+    pid = os.getpid()
+    events = [
+        {
+            "name": name,
+            "cat": name.split(".")[0],
+            "ph": "X",
+            "ts": round((start - STARTED) * 1e6, 1),
+            "dur": round(duration * 1e6, 1),
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        }
+        for name, start, duration, tid, args in recorded
+    ]
+    with open(os.path.expanduser(path), "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
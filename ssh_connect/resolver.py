@@ -0,0 +1,176 @@
+import json
+import socket
+import threading
+import time
+
+from . import profiling
+from .pool import run_jobs
+from .utils import cache_path, atomic_write, file_lock
+
+DNS_CACHE_FILE = "ssh_connect_dns.json"
+DNS_CACHE_VERSION = 1
+
+
+def forward_lookup(host):
+    return socket.gethostbyname(host)
+
+
+def reverse_lookup(ip):
+    return socket.gethostbyaddr(ip)[0]
+
+
+LOOKUPS = {
+    "forward": forward_lookup,
+    "reverse": reverse_lookup,
+}
+
+
+class DnsCache:
+    """
+    Forward/reverse lookup results persisted between runs.
+
+    Entries are [value, timestamp]; a value of None records a failed lookup
+    (negative caching). Entries older than their TTL are still served but
+    reported as stale so they can be revalidated in the background.
+    """
+
+    def __init__(self, path, ttl, negative_ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.data = {kind: {} for kind in LOOKUPS}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, settings, refresh=False):
+        cache = cls(
+            cache_path(DNS_CACHE_FILE),
+            settings.dns_cache_ttl,
+            settings.dns_negative_ttl,
+            settings.dns_cache_size,
+        )
+        if not refresh:
+            cache.data = cache._read()
+        return cache
+
+    def _read(self):
+        data = {kind: {} for kind in LOOKUPS}
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+            if raw.get("version") == DNS_CACHE_VERSION:
+                for kind in LOOKUPS:
+                    data[kind].update(raw.get(kind) or {})
+        except Exception:
+            pass  # missing or corrupt cache: start cold
+        return data
+
+    def get(self, kind, name):
+        """Return (hit, value, stale)."""
+        with self.lock:
+            entry = self.data[kind].get(name)
+        if entry is None:
+            return False, None, False
+        value, stamp = entry
+        ttl = self.ttl if value is not None else self.negative_ttl
+        return True, value, time.time() - stamp > ttl
+
+    def put(self, kind, name, value):
+        with self.lock:
+            self.data[kind][name] = [value, time.time()]
+            self.dirty = True
+
+    def save(self):
+        """
+        Merge our entries into the file, keeping the newer answer where both
+        have one: other threads and processes may have saved since we loaded
+        (and --refresh-dns starts without the file's entries).
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            ours = {kind: dict(table) for kind, table in self.data.items()}
+            self.dirty = False
+
+        try:
+            with file_lock(self.path):
+                data = self._read()
+                for kind, table in ours.items():
+                    for name, entry in table.items():
+                        known = data[kind].get(name)
+                        if known is None or known[1] <= entry[1]:
+                            data[kind][name] = entry
+
+                entries = [
+                    (stamp, kind, name, value)
+                    for kind, table in data.items()
+                    for name, (value, stamp) in table.items()
+                ]
+                if len(entries) > self.max_entries:
+                    # Evict the least recently checked entries
+                    entries.sort(reverse=True)
+                    data = {kind: {} for kind in LOOKUPS}
+                    for stamp, kind, name, value in entries[:self.max_entries]:
+                        data[kind][name] = [value, stamp]
+
+                payload = {"version": DNS_CACHE_VERSION}
+                payload.update(data)
+                atomic_write(self.path, json.dumps(payload))
+        except OSError:
+            pass  # read-only home etc: the cache is an optimisation only
+
+
+def resolve_many(names, kind, settings, cache=None, stale=None, on_result=None):
+    """
+    Resolve all names concurrently. Returns {name: result}; failed or
+    timed-out lookups are missing from the result.
+
+    With a cache, cached answers are used without touching the network and
+    only misses are looked up. Names whose cached answer is past its TTL are
+    appended to `stale` (a list of (kind, name)) for later revalidation.
+    on_result(name, value) is called as each network lookup succeeds.
+    """
+    names = list(dict.fromkeys(names))
+    results = {}
+    missing = names
+
+    if cache is not None:
+        missing = []
+        for name in names:
+            hit, value, expired = cache.get(kind, name)
+            if not hit:
+                missing.append(name)
+                continue
+            if value is not None:
+                results[name] = value
+            if expired and stale is not None:
+                stale.append((kind, name))
+
+    found = run_jobs(
+        profiling.timed("dns.lookup", LOOKUPS[kind], kind=kind), missing, settings.dns_workers,
+        timeout=settings.dns_timeout, on_result=on_result,
+    )
+    results.update(found)
+
+    if cache is not None:
+        for name in missing:
+            cache.put(kind, name, found.get(name))
+
+    return results
+
+
+def revalidate_in_background(cache, stale, settings):
+    """Re-run stale lookups on a daemon thread and persist the fresh answers."""
+    def refresh():
+        for kind in LOOKUPS:
+            names = [name for k, name in stale if k == kind]
+            found = run_jobs(LOOKUPS[kind], names, settings.dns_workers, timeout=settings.dns_timeout)
+            for name in names:
+                cache.put(kind, name, found.get(name))
+        cache.save()
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
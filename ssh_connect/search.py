@@ -0,0 +1,72 @@
+from operator import attrgetter
+
+# Joins the fields of a search key: "<name>\0<ip>\0<host>\0<user>\0<group>\0<tags...>"
+SEPARATOR = "\0"
+
+search_key = attrgetter("search_key")
+
+
+def fuzzy_positions(query, key):
+    """Indices in `key` where the chars of `query` match in order, or None."""
+    positions = []
+    pos = 0
+    for ch in query:
+        pos = key.find(ch, pos)
+        if pos < 0:
+            return None
+        positions.append(pos)
+        pos += 1
+    return positions
+
+
+class FuzzyFilter:
+    """
+    Incremental subsequence filter over a precomputed lowercase index.
+
+    Each cached level is (query, indices, ends): the matching item indices
+    and, per match, where its greedy match ended. Matches of a longer query
+    are a subset of the shorter one's, and greedy matching lets us continue
+    from the previous match end, so typing one more char costs a single
+    str.find per remaining candidate. Backspace just pops back to a cached
+    level.
+    """
+
+    def __init__(self, items, key=search_key):
+        self.key = key
+        self.reset(items)
+
+    def reset(self, items):
+        query = getattr(self, "query", "")
+        self.items = items
+        self.keys = [self.key(item) for item in items]
+        self.levels = [("", range(len(items)), [0] * len(items))]
+        self.query = ""
+        if query:
+            self.set_query(query)
+
+    def set_query(self, query):
+        query = query.lower()
+        levels = self.levels
+        while len(levels) > 1 and not query.startswith(levels[-1][0]):
+            levels.pop()
+
+        base_query, indices, ends = levels[-1]
+        keys = self.keys
+        for n in range(len(base_query), len(query)):
+            ch = query[n]
+            # Parallel lists instead of (index, end) tuples: this loop is the
+            # per-keystroke hot path
+            found = [keys[i].find(ch, end) for i, end in zip(indices, ends)]
+            indices = [i for i, pos in zip(indices, found) if pos >= 0]
+            ends = [pos + 1 for pos in found if pos >= 0]
+            levels.append((query[:n + 1], indices, ends))
+
+        self.query = query
+
+    @property
+    def matches(self):
+        """Indices (into items) of the matching items, in item order."""
+        return self.levels[-1][1]
+
+    def positions(self, index):
+        return fuzzy_positions(self.query, self.keys[index])
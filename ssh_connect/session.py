@@ -1,9 +1,14 @@
 import os
+import shlex
 import shutil
 import subprocess
+import time
 
-from .ui.confirm import ask_confirm
-from .ui.pubkey_selector import select_pubkey
+from . import profiling
+from .health import classify_probe, DOWN, NEEDS_KEY, UP
+from .jump import jump_options
+from .mux import mux_options
+from .utils import cache_path
 
 
 def list_local_pubkeys():
@@ -19,46 +24,132 @@ def list_local_pubkeys():
     return sorted(keys, key=lambda k: (not k.endswith("ed25519.pub"), k))
 
 
-def start_session(con, index, style, save_pos_cb, settings):
-    user = con.get("user", os.getenv("LOGNAME"))
-    host = con["resolved_ip"]
-    port = str(con.get("port", 22))
-    password = con.get("password")
+def probe_argv(con, options):
+    """`ssh ... true` in batch mode: does key auth work, is the host up at all?"""
+    return ["ssh", "-o", "BatchMode=yes", "-o", "ConnectTimeout=3", *options,
+            f"{con.user}@{con.resolved_ip}", "-p", str(con.port), "true"]
 
-    save_pos_cb(index)
+
+def _login_marker():
+    """
+    ssh options that touch a fresh marker file once ssh is logged in
+    (LocalCommand runs right after authentication), and the file's path.
+    """
+    marker = cache_path(f"ssh_connect_login.{os.getpid()}")
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    try:
+        os.unlink(marker)  # from an earlier process with our pid
+    except FileNotFoundError:
+        pass
+    return [
+        "-o", "PermitLocalCommand=yes",
+        # ssh expands %-tokens in LocalCommand
+        "-o", f"LocalCommand=touch {shlex.quote(marker).replace('%', '%%')}",
+    ], marker
+
+
+def _has_local_command(argv):
+    """Does the user's ssh config set a LocalCommand for this target?"""
+    try:
+        out = subprocess.run(
+            ["ssh", "-G", *argv], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, timeout=5,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return True  # can't tell: leave their config alone
+    return any(line.startswith("localcommand ") for line in out.splitlines())
+
+
+def _run_session(argv, timings, prefix=()):
+    """
+    Run the interactive ssh `argv`, behind `prefix` (e.g. sshpass); with
+    `timings`, note how long the login took. Not done when the user's own
+    LocalCommand would be replaced.
+    """
+    if timings is None or _has_local_command(argv[1:]):
+        return subprocess.run([*prefix, *argv])
+
+    options, marker = _login_marker()
+    started = time.time()
+    result = subprocess.run([*prefix, argv[0], *options, *argv[1:]])
+    try:
+        timings["handshake"] = os.stat(marker).st_mtime - started
+        os.unlink(marker)
+    except OSError:
+        pass  # never logged in
+    return result
+
+
+def start_session(con, style_cb, settings, prober=None, timings=None):
+    """
+    Connect to `con`, offering a key upload first if it refuses key auth.
+    Returns the CompletedProcess of the session, or None if none was started.
+
+    With a `prober` (prober.Prober) that already probed `con` while it was
+    under the selector's cursor, the session starts right away. With a
+    `timings` dict, the probe, key upload and login ("handshake") times are
+    stored in it, in seconds. The login is only timed when nobody has to
+    type a password or passphrase for it.
+    """
+    user = con.user
+    host = con.resolved_ip
+    port = str(con.port)
+    password = con.password
+    # Behind a bastion, its master is started here, where ssh may prompt
+    opts = [*mux_options(settings, con), *jump_options(con, settings, batch=False)]
 
     if password:
         if shutil.which("sshpass"):
-            return subprocess.run(
-                ["sshpass", "-p", password, "ssh", f"{user}@{host}", "-p", port]
+            return _run_session(
+                ["ssh", *opts, f"{user}@{host}", "-p", port], timings,
+                prefix=["sshpass", "-p", password],
             )
-        return subprocess.run(["ssh", f"{user}@{host}", "-p", port])
+        # Typed at the prompt: that would be timed as well
+        return _run_session(["ssh", *opts, f"{user}@{host}", "-p", port], None)
 
-    check = subprocess.run(
-        ["ssh", "-o", "BatchMode=yes", "-o", "ConnectTimeout=3",
-         f"{user}@{host}", "-p", port, "true"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-
-    stderr = check.stderr.lower()
-    need_key = any(x in stderr for x in ["permission denied", "publickey", "password:"])
-    unreachable = any(x in stderr for x in ["timed out", "connection refused", "no route"])
+    # With multiplexing on, a successful probe leaves a master connection
+    # behind that the session below reuses
+    with profiling.span("session.probe", host=host):
+        status = prober.status(con) if prober else None
+        if status is not None:
+            took = prober.took(con)
+        else:
+            start = time.monotonic()
+            check = subprocess.run(
+                probe_argv(con, opts),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            took = time.monotonic() - start
+            status = classify_probe(check.returncode, check.stderr)
+    if timings is not None:
+        timings["probe"] = took
 
-    if unreachable:
+    if status == DOWN:
         print(f"Host {host} unreachable.")
         return
 
-    # Per-host setting overrides global; global default comes from settings
-    skip_key = con.get("skip_key_setup", settings.skip_key_setup)
+    # Per-host setting overrides global (resolved when the config is loaded)
+    if status == NEEDS_KEY and not con.skip_key_setup:
+        # Only now do we need the prompt_toolkit UI
+        from .ui.confirm import ask_confirm
+        from .ui.pubkey_selector import select_pubkey
 
-    if need_key and not skip_key:
+        style = style_cb()
         if ask_confirm(f"No key on {host}. Upload one?", style):
-            keys = list_local_pubkeys()
+            keys = prober.keys() if prober else list_local_pubkeys()
             key = select_pubkey(keys, style)
             if not key:
                 return
-            subprocess.run(["ssh-copy-id", "-i", key, "-p", port, f"{user}@{host}"])
+            # ssh-copy-id's own ssh becomes the master when multiplexing,
+            # so the session doesn't authenticate a second time
+            start = time.monotonic()
+            subprocess.run(["ssh-copy-id", "-i", key, *opts, "-p", port, f"{user}@{host}"])
+            if timings is not None:
+                timings["key_upload"] = time.monotonic() - start
 
-    return subprocess.run(["ssh", f"{user}@{host}", "-p", port])
+    # Only a batch-mode login shows the session won't prompt for anything
+    login = timings if status == UP else None
+    return _run_session(["ssh", *opts, f"{user}@{host}", "-p", port], login)
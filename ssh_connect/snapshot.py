@@ -0,0 +1,49 @@
+import hashlib
+import os
+import pickle
+
+from .utils import cache_path, atomic_write
+
+# Bump when the snapshot layout or the meaning of its contents changes
+MAGIC = b"SSHCONNECT-SNAPSHOT-2\n"
+
+
+def _snapshot_path(path):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return cache_path(f"ssh_connect_config_{digest}.pickle")
+
+
+def _file_key(path, raw):
+    st = os.stat(path)
+    return (
+        os.path.abspath(path),
+        st.st_mtime_ns,
+        st.st_size,
+        hashlib.sha1(raw.encode()).hexdigest(),
+    )
+
+
+def load_snapshot(path, raw):
+    """
+    Return the document (settings, includes, groups, hosts) compiled from
+    `raw` on an earlier run, or None when there is no snapshot or the file
+    changed since. Every config file and fragment has its own snapshot.
+    """
+    try:
+        with open(_snapshot_path(path), "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            data = pickle.load(f)
+        if data["key"] != _file_key(path, raw):
+            return None
+        return data["document"]
+    except Exception:
+        return None
+
+
+def save_snapshot(path, raw, document):
+    data = {"key": _file_key(path, raw), "document": document}
+    try:
+        atomic_write(_snapshot_path(path), MAGIC + pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass  # the snapshot is an optimisation only
@@ -0,0 +1,60 @@
+import os
+
+SORT_MODES = ("ip", "name", "recent", "frequency", "group")
+
+# History entry (last_used, count, ...) of a host never connected to
+NEVER = (0, 0)
+
+
+def sort_mode(settings):
+    """SSH_CONNECT_SORT overrides the `sort` setting; unknown modes fall back to ip."""
+    mode = os.getenv("SSH_CONNECT_SORT", settings.sort).strip().lower()
+    return mode if mode in SORT_MODES else "ip"
+
+
+class Sorter:
+    """
+    Sorts hosts in place by one of SORT_MODES.
+
+    All keys are precomputed on the Host (sort_key, name_key) or are a dict
+    lookup in the history summary, so switching modes is a single key-based
+    sort, not a re-parse of names and addresses.
+    """
+
+    def __init__(self, mode="ip", history=None):
+        self.mode = mode
+        self._history = history
+
+    @property
+    def history(self):
+        if self._history is None:
+            from .history import History
+            self._history = History()
+        return self._history
+
+    def key(self):
+        mode = self.mode
+        if mode == "name":
+            return lambda h: h.name_key
+
+        if mode == "recent":
+            get = self.history.entries.get
+            return lambda h: (-get(h.key, NEVER)[0], h.sort_key)
+
+        if mode == "frequency":
+            get = self.history.entries.get
+            return lambda h: (-get(h.key, NEVER)[1], -get(h.key, NEVER)[0], h.sort_key)
+
+        if mode == "group":
+            # Ungrouped hosts last
+            return lambda h: (h.group is None, h.group or "", h.sort_key)
+
+        return lambda h: h.sort_key
+
+    def sort(self, hosts):
+        hosts.sort(key=self.key())
+        return hosts
+
+    def cycle(self):
+        self.mode = SORT_MODES[(SORT_MODES.index(self.mode) + 1) % len(SORT_MODES)]
+        return self.mode
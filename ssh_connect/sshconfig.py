@@ -0,0 +1,207 @@
+import fnmatch
+import glob
+import os
+import pickle
+import re
+import shlex
+
+from .host import is_ip
+from .utils import cache_path, atomic_write
+
+SSH_CONFIG = "~/.ssh/config"
+KNOWN_HOSTS = "~/.ssh/known_hosts"
+
+INDEX_FILE = "ssh_connect_ssh_import.pickle"
+# Bump when the index layout or the parsing rules change
+MAGIC = b"SSHCONNECT-SSHIMPORT-2\n"
+
+# Options taken over from ~/.ssh/config (lowercase, as ssh matches them)
+OPTIONS = ("hostname", "user", "port", "proxyjump")
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# "Keyword value" or "Keyword=value"
+LINE = re.compile(r"(\w+)\s*(?:=\s*|\s+)(.*)")
+
+
+def _words(line):
+    m = LINE.match(line)
+    if not m:
+        return line.lower(), []
+    try:
+        args = shlex.split(m.group(2))
+    except ValueError:
+        args = m.group(2).split()
+    return m.group(1).lower(), args
+
+
+def parse_ssh_config(path, files=None, seen=None):
+    """
+    Return [(patterns, options)] blocks of an ssh config and the files it
+    includes. `files` collects every file read (for the cache key).
+    """
+    files = {} if files is None else files
+    seen = set() if seen is None else seen
+    path = os.path.expanduser(path)
+    if path in seen:
+        return []
+    seen.add(path)
+    files[path] = _stat(path)
+
+    try:
+        with open(path, errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+
+    blocks = []
+    current = [["*"], {}]  # options before the first Host line apply to all
+    blocks.append(current)
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, args = _words(line)
+        if key == "host":
+            current = [args, {}]
+            blocks.append(current)
+        elif key == "match":
+            current = [[], {}]  # Match blocks are not evaluated
+        elif key == "include":
+            for pattern in args:
+                pattern = os.path.expanduser(pattern)
+                if not os.path.isabs(pattern):
+                    pattern = os.path.join(os.path.expanduser("~/.ssh"), pattern)
+                for included in sorted(glob.glob(pattern)):
+                    blocks.extend(parse_ssh_config(included, files, seen))
+        elif key in OPTIONS and args:
+            current[1].setdefault(key, args[0])
+    return blocks
+
+
+def _matches(alias, patterns):
+    # ssh matches Host patterns case-insensitively
+    alias = alias.lower()
+    hit = False
+    for pattern in patterns:
+        if pattern.startswith("!"):
+            if fnmatch.fnmatchcase(alias, pattern[1:].lower()):
+                return False
+        elif fnmatch.fnmatchcase(alias, pattern.lower()):
+            hit = True
+    return hit
+
+
+def ssh_config_entries(blocks):
+    """Host entries for every concrete (non-wildcard) Host alias."""
+    aliases = []
+    for patterns, _ in blocks:
+        for p in patterns:
+            if not p.startswith("!") and not any(c in p for c in "*?["):
+                aliases.append(p)
+
+    entries = []
+    for alias in dict.fromkeys(aliases):
+        # Like ssh: the first value found for an option wins
+        options = {}
+        for patterns, block in blocks:
+            if _matches(alias, patterns):
+                for key, value in block.items():
+                    options.setdefault(key, value)
+        entry = {"host": options.get("hostname", alias).replace("%h", alias), "name": alias}
+        if "user" in options:
+            entry["user"] = options["user"]
+        if "port" in options:
+            entry["port"] = options["port"]
+        if "proxyjump" in options and options["proxyjump"].lower() != "none":
+            entry["proxy_jump"] = options["proxyjump"]
+        entry["tags"] = ["ssh_config"]
+        entries.append(entry)
+    return entries
+
+
+def _split_port(name):
+    # "[host]:port" is used for non-standard ports
+    if name.startswith("[") and "]:" in name:
+        host, _, port = name[1:].partition("]:")
+        return host, port
+    return name, 22
+
+
+def known_hosts_entries(path):
+    """One entry per known_hosts line; hashed and marker lines are skipped."""
+    entries = []
+    try:
+        f = open(os.path.expanduser(path), errors="replace")
+    except OSError:
+        return entries
+    with f:
+        for line in f:
+            if not line or line[0] in "#|@\n":
+                continue
+            names = [_split_port(n) for n in line.split(None, 1)[0].split(",")]
+            # Prefer a name over an address when a line lists both
+            host, port = next((n for n in names if not is_ip(n[0])), names[0])
+            if any(c in host for c in "*?!"):
+                continue
+            entries.append({"host": host, "port": port, "tags": ["known_hosts"]})
+    return entries
+
+
+def _load_index(files):
+    try:
+        with open(cache_path(INDEX_FILE), "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            data = pickle.load(f)
+    except Exception:
+        return None
+    # Valid while none of the files read last time changed
+    if data["sources"] != files or any(_stat(p) != st for p, st in data["files"].items()):
+        return None
+    return data["entries"]
+
+
+def _save_index(files, read, entries):
+    data = {"sources": files, "files": read, "entries": entries}
+    try:
+        atomic_write(cache_path(INDEX_FILE), MAGIC + pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass  # the index is an optimisation only
+
+
+def imported_entries(settings):
+    """
+    Host entries from ~/.ssh/config and/or known_hosts, as enabled in
+    `settings`, ssh config first. Cached until any of the files read
+    (including ssh config Includes) changes.
+    """
+    sources = []
+    if settings.import_ssh_config:
+        sources.append(("ssh_config", os.path.expanduser(SSH_CONFIG)))
+    if settings.import_known_hosts:
+        sources.append(("known_hosts", os.path.expanduser(KNOWN_HOSTS)))
+    if not sources:
+        return []
+
+    entries = _load_index(sources)
+    if entries is not None:
+        return entries
+
+    read = {}
+    entries = []
+    for kind, path in sources:
+        if kind == "ssh_config":
+            entries += ssh_config_entries(parse_ssh_config(path, read))
+        else:
+            read[path] = _stat(path)
+            entries += known_hosts_entries(path)
+    _save_index(sources, read, entries)
+    return entries
@@ -0,0 +1,98 @@
+# A host regressed when the median of its last RECENT connects is REGRESSION
+# times (and MIN_SLOWDOWN seconds) slower than the median of those before,
+# given at least MIN_BEFORE of them
+RECENT = 5
+MIN_BEFORE = 5
+REGRESSION = 1.5
+MIN_SLOWDOWN = 0.05
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def connect_latency(handshake, probe):
+    """Time to a logged-in session: the login itself if measured, else the probe."""
+    return handshake if handshake is not None else probe
+
+
+def regression(latencies):
+    """(median before, recent median) if the recent connects got slower, else None."""
+    if len(latencies) < RECENT + MIN_BEFORE:
+        return None
+    before = percentile(latencies[:-RECENT], 50)
+    recent = percentile(latencies[-RECENT:], 50)
+    if recent > before * REGRESSION and recent - before > MIN_SLOWDOWN:
+        return before, recent
+    return None
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+
+def _header(title):
+    return f"  {title:<28} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'probe':>8} {'failed':>6}"
+
+
+def _samples():
+    return {"count": 0, "latency": [], "probe": [], "failed": 0}
+
+
+def _row(label, samples):
+    latencies, probes = samples["latency"], samples["probe"]
+    return (f"  {label:<28} {samples['count']:>5} "
+            f"{_ms(percentile(latencies, 50) if latencies else None):>8} "
+            f"{_ms(percentile(latencies, 95) if latencies else None):>8} "
+            f"{_ms(percentile(probes, 50) if probes else None):>8} {samples['failed']:>6}")
+
+
+def print_stats(connections, history, days):
+    """p50/p95 connect latency per host and per group, with regressed hosts flagged."""
+    by_key = {}
+    for key, _, probe, handshake, _, _, exit_status in history.metrics():
+        latency = connect_latency(handshake, probe)
+        samples = by_key.setdefault(key, _samples())
+        samples["count"] += 1
+        if latency is not None:
+            samples["latency"].append(latency)
+        if probe is not None:
+            samples["probe"].append(probe)
+        # ssh exits with 255 when the connection itself failed
+        samples["failed"] += exit_status == 255
+
+    if not by_key:
+        print("No session metrics recorded yet (set session_metrics: true).")
+        return
+
+    hosts = {c.key: c for c in connections}
+    print(f"\nConnect latency per host, last {days} days\n")
+    print(_header("host"))
+
+    groups = {}
+    regressed = 0
+    for key in sorted(by_key):
+        samples = by_key[key]
+        con = hosts.get(key)
+        line = _row(key, samples)
+        slower = regression(samples["latency"])
+        if slower:
+            regressed += 1
+            line += f"  regressed: {_ms(slower[0])} -> {_ms(slower[1])} ms"
+        print(line)
+
+        # Hosts no longer in the config count as ungrouped
+        group = groups.setdefault(con.group if con else None, _samples())
+        for field in group:
+            group[field] += samples[field]
+
+    if any(name is not None for name in groups):
+        print("\nPer group\n")
+        print(_header("group"))
+        for name in sorted(groups, key=lambda g: (g is None, g or "")):
+            print(_row(name or "(no group)", groups[name]))
+
+    if regressed:
+        print(f"\n{regressed} host(s) slower over their last {RECENT} connects than before.")
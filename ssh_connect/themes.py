@@ -1,5 +1,3 @@
-from prompt_toolkit.styles import Style
-
 THEMES = {
     "solarized-dark": {
         "question":   "#b58900 bold",
@@ -80,6 +78,18 @@ THEMES = {
     },
 }
 
+# Tokens every theme gets unless it defines its own
+DEFAULT_TOKENS = {
+    "match": "underline",
+    "status_up": "#4caf50",
+    "status_down": "#f44336",
+    "status_needs-key": "#ffc107",
+    "status_error": "#ff9800",
+}
+
+
 def get_style(theme="material"):
+    from prompt_toolkit.styles import Style
+
     tokens = THEMES.get(theme.lower(), THEMES["material"])
-    return Style.from_dict(tokens)
+    return Style.from_dict({**DEFAULT_TOKENS, **tokens})
@@ -0,0 +1,234 @@
+import functools
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from .jump import jump_options
+from .mux import mux_options
+from .pool import run_jobs
+
+PUSH = "push"
+PULL = "pull"
+
+# rsync --info=progress2 line: "  12,345,678  42%  1.23MB/s    0:00:05"
+PROGRESS = re.compile(r"^\s*([\d,]+)\s+(\d+)%")
+# End of a file's --progress lines: "(xfer#3, to-check=5/10)", "(xfr#3, to-chk=5/10)"
+FILE_DONE = re.compile(r"to-che?c?k=(\d+)/(\d+)")
+# --info=progress2 (one line for the whole transfer) is new in rsync 3.1
+OVERALL_PROGRESS = (3, 1)
+
+
+def remote(con, path):
+    host = con.resolved_ip
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    return f"{con.user}@{host}:{path}"
+
+
+def host_dirs(base, connections):
+    """A local directory per host for pulls, named after the host."""
+    dirs, taken = {}, set()
+    for con in connections:
+        name = re.sub(r"[^\w.@-]", "_", con.resolved_name) or con.host
+        if name in taken:
+            name = f"{name}-{con.port}-{con.user}"
+        taken.add(name)
+        dirs[con] = os.path.join(base, name)
+    return dirs
+
+
+@functools.lru_cache(maxsize=None)
+def rsync_version():
+    """(major, minor) of the local rsync, (0, 0) if unknown."""
+    try:
+        out = subprocess.run(
+            ["rsync", "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout
+    except OSError:
+        return (0, 0)
+    m = re.search(r"version\s+(\d+)\.(\d+)", out)
+    return (int(m.group(1)), int(m.group(2))) if m else (0, 0)
+
+
+def transfer_command(con, direction, source, target, settings):
+    """rsync (resumable, with progress) if installed, else scp -r."""
+    port = str(con.port)
+    opts = [*mux_options(settings, con), *jump_options(con, settings)]
+    if not con.password:
+        opts = ["-o", "BatchMode=yes", *opts]
+
+    if direction == PUSH:
+        paths = [source, remote(con, target)]
+    else:
+        paths = [remote(con, source), target.rstrip("/") + "/"]
+
+    if shutil.which("rsync"):
+        if rsync_version() >= OVERALL_PROGRESS:
+            progress = ["--info=progress2", "--no-inc-recursive"]
+        else:
+            progress = ["--progress"]  # per file
+        argv = [
+            "rsync", "-a", "--partial", *progress,
+            "-e", shlex.join(["ssh", "-p", port, *opts]), *paths,
+        ]
+    else:
+        # scp can't resume; a retry starts over
+        argv = ["scp", "-r", "-q", "-P", port, *opts, *paths]
+
+    if con.password and shutil.which("sshpass"):
+        argv = ["sshpass", "-p", con.password, *argv]
+    return argv
+
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+class Progress:
+    """Per-host percentage and bytes, shared between the workers and the UI."""
+
+    def __init__(self, connections):
+        self.lock = threading.Lock()
+        self.percent = dict.fromkeys(connections, 0)
+        self.bytes = dict.fromkeys(connections, 0)
+        self.done = 0
+        self.start = time.monotonic()
+        self.on_change = None
+
+    def update(self, con, nbytes=None, percent=None):
+        with self.lock:
+            if nbytes is not None:
+                self.bytes[con] = nbytes
+            if percent is not None:
+                self.percent[con] = percent
+        if self.on_change:
+            self.on_change(con)
+
+    def throughput(self):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        return sum(self.bytes.values()) / elapsed
+
+    def summary(self):
+        total = len(self.percent)
+        return (f"{self.done}/{total} hosts done  ·  "
+                f"{format_bytes(sum(self.bytes.values()))}  ·  "
+                f"{format_bytes(self.throughput())}/s")
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def run_transfer(con, direction, source, target, settings, progress):
+    """
+    Copy with up to transfer_retries retries; rsync keeps partial files, so
+    a retry resumes instead of starting over. Returns the last exit status.
+    """
+    if direction == PULL:
+        os.makedirs(target, exist_ok=True)
+    argv = transfer_command(con, direction, source, target, settings)
+    per_file = "--progress" in argv
+
+    for attempt in range(settings.transfer_retries + 1):
+        if attempt:
+            time.sleep(min(2 ** attempt, 10))
+        proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,  # universal newlines split rsync's \r progress updates
+            errors="replace",
+        )
+        copied = 0
+        for line in proc.stdout:
+            m = PROGRESS.match(line)
+            if not m:
+                continue
+            nbytes, percent = int(m.group(1).replace(",", "")), int(m.group(2))
+            if per_file:
+                # Only count whole files, and the share of files done
+                files = FILE_DONE.search(line)
+                if not files:
+                    continue
+                copied += nbytes
+                left, total = int(files.group(1)), int(files.group(2))
+                nbytes, percent = copied, 100 * (total - left) // max(total, 1)
+            progress.update(con, nbytes, percent)
+        if proc.wait() == 0:
+            break
+
+    if proc.returncode == 0:
+        if not progress.bytes[con]:
+            # scp reports nothing; count the local copy instead: the source
+            # of a push, what arrived for a pull
+            progress.update(con, disk_usage(source if direction == PUSH else target))
+        progress.update(con, percent=100)
+    return proc.returncode
+
+
+def transfer(connections, direction, source, target, settings, style=None):
+    """
+    Push `source` to `target` on every host, or pull `source` from every
+    host into `target`/<host>/, transfer_workers hosts at a time.
+
+    Shows a progress bar per host plus total throughput when attached to a
+    terminal. Returns {host: exit status}.
+    """
+    progress = Progress(connections)
+    targets = host_dirs(target, connections) if direction == PULL else dict.fromkeys(connections, target)
+
+    def job(con):
+        try:
+            return run_transfer(con, direction, source, targets[con], settings, progress)
+        finally:
+            with progress.lock:
+                progress.done += 1
+
+    if sys.stdout.isatty():
+        from prompt_toolkit.shortcuts import ProgressBar
+
+        with ProgressBar(
+            title=f"{direction} {source} → {target}",
+            bottom_toolbar=progress.summary,
+            style=style,
+        ) as bar:
+            counters = {con: bar(label=con.resolved_name, total=100) for con in connections}
+
+            def on_change(con):
+                counters[con].items_completed = progress.percent[con]
+                bar.invalidate()
+
+            progress.on_change = on_change
+            results = run_jobs(job, connections, settings.transfer_workers)
+            for con, counter in counters.items():
+                if results.get(con) == 0:
+                    counter.done = True
+                else:
+                    counter.stopped = True
+    else:
+        results = run_jobs(job, connections, settings.transfer_workers)
+
+    failed = [c for c in connections if results.get(c) != 0]
+    print(f"{len(connections) - len(failed)} of {len(connections)} hosts ok  ·  {progress.summary()}")
+    for con in failed:
+        print(f"  {con.resolved_name:<25} {con.resolved_ip:<18} exit {results.get(con, 'not run')}")
+    return results
@@ -0,0 +1,124 @@
+from prompt_toolkit.application.current import get_app_session
+
+
+class ListView:
+    """
+    Scrolling viewport over a list of rows.
+
+    Only the rows that fit on screen are rendered. Each row's fragments are
+    cached per (row, selected) so moving the cursor re-renders two rows, not
+    the whole list; call invalidate() when row contents change.
+
+    render_row(row, selected) must return a fragment list ending in "\\n".
+    None rows are separators the cursor steps over.
+    """
+
+    def __init__(self, render_row, reserved_lines=4, max_cache=2000):
+        self.render_row = render_row
+        self.reserved_lines = reserved_lines
+        self.max_cache = max_cache
+        self.cache = {}
+        self.selected = 0
+        self.offset = 0
+        self.count = 0
+        self.rows = []
+
+    @property
+    def height(self):
+        try:
+            rows = get_app_session().output.get_size().rows
+        except Exception:
+            rows = 24
+        return max(1, rows - self.reserved_lines)
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def move(self, delta, wrap=False):
+        if not self.count:
+            return
+        if wrap:
+            self.selected = (self.selected + delta) % self.count
+        else:
+            self.selected = max(0, min(self.count - 1, self.selected + delta))
+        self._after_move(1 if delta > 0 else -1, wrap)
+
+    def page(self, pages):
+        self.move(pages * self.height)
+
+    def home(self):
+        self.selected = 0
+        self._after_move(1)
+
+    def end(self):
+        self.selected = max(0, self.count - 1)
+        self._after_move(-1)
+
+    def _after_move(self, step, wrap=False):
+        # Step off a separator in the direction of the move, or back from
+        # the first/last row
+        rows = self.rows
+        if len(rows) != self.count:
+            return
+        for _ in range(2 * len(rows)):
+            if rows[self.selected] is not None:
+                return
+            n = self.selected + step
+            if wrap:
+                n %= len(rows)
+            elif not 0 <= n < len(rows):
+                step = -step
+                continue
+            self.selected = n
+
+    def render(self, rows):
+        self.rows = rows
+        self.count = count = len(rows)
+        if not count:
+            return []
+
+        height = self.height
+        selected = self.selected = max(0, min(count - 1, self.selected))
+
+        # Scroll just enough to keep the cursor visible
+        if selected < self.offset:
+            self.offset = selected
+        elif selected >= self.offset + height:
+            self.offset = selected - height + 1
+        self.offset = max(0, min(self.offset, count - height))
+
+        if len(self.cache) > self.max_cache:
+            self.cache.clear()
+
+        output = []
+        for n in range(self.offset, min(count, self.offset + height)):
+            key = (rows[n], n == selected)
+            frags = self.cache.get(key)
+            if frags is None:
+                frags = self.cache[key] = self.render_row(rows[n], n == selected)
+            output.extend(frags)
+        return output
+
+    def status(self):
+        if not self.count:
+            return "no rows"
+        return f"row {self.selected + 1} of {self.count}"
+
+    def bind_keys(self, kb):
+        """Add PageUp/PageDown/Home/End to a KeyBindings object."""
+
+        @kb.add("pageup")
+        def _(event):
+            self.page(-1)
+
+        @kb.add("pagedown")
+        def _(event):
+            self.page(1)
+
+        @kb.add("home")
+        def _(event):
+            self.home()
+
+        @kb.add("end")
+        def _(event):
+            self.end()
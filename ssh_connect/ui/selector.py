@@ -1,81 +1,360 @@
+import time
+from html import escape
+
 from prompt_toolkit import Application
 from prompt_toolkit.layout import Layout, HSplit
 from prompt_toolkit.layout.controls import FormattedTextControl
 from prompt_toolkit.layout.containers import Window
 from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.formatted_text import HTML, to_formatted_text
+from prompt_toolkit.formatted_text import HTML
+
+from .. import profiling
+from ..search import FuzzyFilter, SEPARATOR
+from ..sorting import Sorter
+from .listview import ListView
+
+
+def _marked(style, text, positions):
+    """Fragments for text, with the chars at `positions` in the match style."""
+    if not positions:
+        return [(style, text)]
+    return [
+        (f"{style},match" if i in positions else style, ch)
+        for i, ch in enumerate(text)
+    ]
 
 
-def make_line(idx, con, selected):
-    name = con["resolved_name"]
-    ip = con["resolved_ip"]
+def make_line(idx, con, selected, positions=None, marked=None, latency=None):
+    name = con.resolved_name
+    ip = con.resolved_ip
     arrow = "❯" if selected else " "
+    prefix = "class:sel_" if selected else "class:"
 
-    if selected:
-        html = HTML(
-            f"<sel_cursor>{arrow}</sel_cursor> "
-            f"<sel_index>{idx:>2}</sel_index> "
-            f"<sel_name>{name:<20}</sel_name> "
-            f"<sel_ip>{ip}</sel_ip>"
-        )
+    # Positions index the search key: "<name>\0<ip>\0..."
+    name_hits, ip_hits = set(), set()
+    for p in positions or ():
+        if p < len(name):
+            name_hits.add(p)
+        elif len(name) < p <= len(name) + len(ip):
+            ip_hits.add(p - len(name) - len(SEPARATOR))
+
+    frags = [
+        (prefix + "cursor", arrow),
+        ("", " "),
+    ]
+    if marked is not None:
+        frags += [(prefix + "cursor", "◉" if marked else "○"), ("", " ")]
+    if con.status is not None:
+        # Reachability marker column, present while/after a sweep ran
+        status = con.status
+        frags += [(f"class:status_{status}", "●") if status else ("", " "), ("", " ")]
+    frags += [
+        (prefix + "index", f"{idx:>2}"),
+        ("", " "),
+    ]
+    frags += _marked(prefix + "name", f"{name:<20}", name_hits)
+    frags.append(("", " "))
+    if latency is not None:
+        frags += _marked(prefix + "ip", f"{ip:<15}", ip_hits)
+        frags.append(("class:index", f" {latency * 1000:>5.0f} ms"))
     else:
-        html = HTML(
-            f"<cursor>{arrow}</cursor> "
-            f"<index>{idx:>2}</index> "
-            f"<name>{name:<20}</name> "
-            f"<ip>{ip}</ip>"
-        )
-
-    frags = list(to_formatted_text(html))
+        frags += _marked(prefix + "ip", ip, ip_hits)
     frags.append(("", "\n"))
     return frags
 
 
-def build_menu(connections, selected):
-    output = []
-    for idx, c in enumerate(connections, 1):
-        output.extend(make_line(idx, c, selected == idx - 1))
-    return output
+def make_separator():
+    return [("class:index", "  " + "─" * 30), ("", "\n")]
 
 
-def select_host(connections, default, style):
-    selected = default
+def make_group_line(name, count, expanded, selected):
+    prefix = "class:sel_" if selected else "class:"
+    return [
+        (prefix + "cursor", "❯" if selected else " "),
+        ("", " "),
+        (prefix + "question", f"{'▾' if expanded else '▸'} {name}"),
+        ("class:index", f" ({count})"),
+        ("", "\n"),
+    ]
 
-    body = FormattedTextControl(
-        text=lambda: build_menu(connections, selected),
-        focusable=True,
-    )
+
+def select_host(connections, default, style, tasks=(), sorter=None, pinned=(),
+                multi=False, groups=False, on_expand=None, on_cursor=None, latencies=None):
+    """
+    Let the user pick a connection; returns its index or None.
+
+    With `multi`, Tab marks/unmarks hosts and Ctrl-A all shown ones; the
+    result is then the list of marked indices (or just the one under the
+    cursor if none are marked).
+
+    The cursor starts on `default` (a Host) if given. `pinned` hosts (e.g.
+    the most used ones) are listed again above the rest, behind a separator,
+    while no query is typed.
+
+    With `groups`, hosts that have a group are folded under one header row
+    per group while no query is typed; Enter/Right/Left expand and collapse
+    it. The first time a group is expanded, on_expand(hosts, on_update) is
+    called with its hosts, e.g. to resolve them only now.
+
+    Typing filters the list (fuzzy match over name, host, IP and user),
+    Backspace edits the query and Escape clears it (or quits when empty).
+    Only the rows that fit on screen are rendered. Ctrl-O cycles the sort
+    order of `sorter` (a sorting.Sorter).
+
+    `latencies` ({Host.key: seconds}) are shown after the IP.
+
+    on_cursor(host) is called after a redraw whenever a different host (or
+    None, e.g. on a group header) is under the cursor, e.g. to probe it.
+
+    Each of `tasks` (e.g. DNS resolution) is called as task(on_update) right
+    after the app is up, so the first frame never waits on them. They update
+    entries in place and call on_update(); the list is then re-sorted (in
+    place) on the next redraw with the cursor kept on the same host. A task
+    that adds or removes hosts calls on_update(change) instead, and
+    change(connections) is run on the UI thread before that re-sort.
+    """
+    started = time.perf_counter()
+    if sorter is None:
+        sorter = Sorter()
+    search = FuzzyFilter(connections)
+    # Rows on screen: indices into connections, None for the separator,
+    # group names for group headers
+    rows = []
+    matches = search.matches
+    marked = set()   # Host objects, so marks survive re-sorting
+    members = {}     # group name -> indices, while grouped
+    expanded = set()
+    loaded = set()   # groups passed to on_expand
+    pending = []     # list changes from on_update(change)
+    dirty = False
+
+    def render_row(i, selected):
+        if i is None:
+            return make_separator()
+        if isinstance(i, str):
+            return make_group_line(i, len(members.get(i, ())), i in expanded, selected)
+        positions = search.positions(i) if search.query else None
+        con = connections[i]
+        return make_line(i + 1, con, selected, positions, con in marked if multi else None,
+                         latencies.get(con.key) if latencies is not None else None)
+
+    view = ListView(render_row)
+
+    def grouped():
+        members.clear()
+        loose = []
+        for i in matches:
+            group = connections[i].group
+            if group is None:
+                loose.append(i)
+            else:
+                members.setdefault(group, []).append(i)
+        out = []
+        for group in sorted(members):
+            out.append(group)
+            if group in expanded:
+                out.extend(members[group])
+        return out + loose
+
+    def build_rows():
+        nonlocal rows
+        rows = matches
+        if groups and not search.query:
+            rows = grouped()
+        if pinned and not search.query:
+            index = {id(con): i for i, con in enumerate(connections)}
+            top = [index[id(con)] for con in pinned if id(con) in index]
+            if top:
+                rows = top + [None] + list(rows)
+        view.count = len(rows)  # keys may move the cursor before the next render
+
+    def cursor():
+        """The Host or group name under the cursor."""
+        if not rows:
+            return None
+        i = rows[min(view.selected, len(rows) - 1)]
+        return connections[i] if isinstance(i, int) else i
+
+    def select(target):
+        view.selected = 0
+        for row, i in enumerate(rows):
+            if i is not None and (i == target if isinstance(i, str) else connections[i] is target):
+                view.selected = row
+                break
+
+    def current():
+        target = cursor()
+        return None if isinstance(target, str) else target
+
+    def load(group):
+        if on_expand and group not in loaded:
+            loaded.add(group)
+            on_expand([connections[i] for i in members.get(group, ())], on_update)
+
+    def expand(group, on):
+        if on:
+            expanded.add(group)
+            load(group)
+        else:
+            expanded.discard(group)
+        refresh()
+        select(group)
+
+    def refresh(resort=False):
+        # Re-sort/re-index after DNS updates or a sort mode change and
+        # re-apply the query, keeping the cursor on the same host where it
+        # is still shown
+        nonlocal matches, dirty
+        target = cursor()
+        while pending:
+            pending.pop(0)(connections)
+        if dirty or resort:
+            dirty = False
+            sorter.sort(connections)
+            search.reset(connections)
+        matches = search.matches
+        build_rows()
+        view.invalidate()
+        select(target)
+
+    def move(delta):
+        view.move(delta, wrap=True)
+
+    def render():
+        if dirty:
+            refresh()
+        return view.render(rows)
+
+    def header():
+        text = "<question>Choose host to connect to:</question>"
+        if search.query:
+            text += f" {escape(search.query)} <index>({len(matches)}/{len(connections)})</index>"
+        return HTML(text)
+
+    def set_query(query):
+        search.set_query(query)
+        refresh()
+
+    def on_update(change=None):
+        nonlocal dirty
+        if change is not None:
+            pending.append(change)
+        dirty = True
+        app.invalidate()
+
+    def status_line():
+        text = f"{view.status()}  ·  sort: {sorter.mode} (Ctrl-O)"
+        if multi:
+            text += f"  ·  {len(marked)} marked (Tab, Ctrl-A)"
+        return text
+
+    body = FormattedTextControl(text=render, focusable=True)
 
     root = HSplit([
-        Window(FormattedTextControl(HTML("<question>Choose host to connect to:</question>")),
-               dont_extend_height=True),
+        Window(FormattedTextControl(header), dont_extend_height=True),
         Window(height=1, char=" "),
         Window(body, always_hide_cursor=True),
+        Window(FormattedTextControl(
+            lambda: [("class:index", status_line())]
+        ), height=1),
     ])
 
     kb = KeyBindings()
+    view.bind_keys(kb)
 
     @kb.add("up")
-    @kb.add("k")
+    @kb.add("c-p")
     def _(event):
-        nonlocal selected
-        selected = (selected - 1) % len(connections)
+        move(-1)
 
     @kb.add("down")
-    @kb.add("j")
+    @kb.add("c-n")
+    def _(event):
+        move(1)
+
+    @kb.add("c-o")
+    def _(event):
+        sorter.cycle()
+        refresh(resort=True)
+
+    if multi:
+        @kb.add("tab")
+        def _(event):
+            target = cursor()
+            if isinstance(target, str):
+                # A group header marks/unmarks the whole group
+                hosts = {connections[i] for i in members.get(target, ())}
+                if hosts <= marked:
+                    marked.difference_update(hosts)
+                else:
+                    marked.update(hosts)
+            elif target is not None:
+                marked.symmetric_difference_update((target,))
+            view.invalidate()
+            move(1)
+
+        @kb.add("c-a")
+        def _(event):
+            shown = {connections[i] for i in matches}
+            if shown <= marked:
+                marked.difference_update(shown)
+            else:
+                marked.update(shown)
+            view.invalidate()
+
+    @kb.add("right")
+    def _(event):
+        target = cursor()
+        if isinstance(target, str):
+            expand(target, True)
+
+    @kb.add("left")
+    def _(event):
+        target = cursor()
+        if isinstance(target, str):
+            expand(target, False)
+        elif target is not None and target.group in expanded and not search.query:
+            expand(target.group, False)
+
+    @kb.add("<any>")
+    def _(event):
+        if event.data.isprintable():
+            set_query(search.query + event.data)
+
+    @kb.add("backspace")
     def _(event):
-        nonlocal selected
-        selected = (selected + 1) % len(connections)
+        set_query(search.query[:-1])
 
     @kb.add("enter")
     def _(event):
-        event.app.exit(result=selected)
+        render()  # apply a pending re-sort so the index matches the list
+        target = cursor()
+        if isinstance(target, str):
+            expand(target, target not in expanded)
+            return
+        host = target
+        if multi and marked:
+            event.app.exit(result=[i for i, con in enumerate(connections) if con in marked])
+        elif host is not None:
+            index = connections.index(host)
+            event.app.exit(result=[index] if multi else index)
 
     @kb.add("escape")
+    def _(event):
+        if search.query:
+            set_query("")
+        else:
+            event.app.exit(result=None)
+
     @kb.add("c-c")
     def _(event):
         event.app.exit(result=None)
- 
+
+    if groups and default is not None and default.group is not None:
+        expanded.add(default.group)
+    build_rows()
+    select(default)
+
     app = Application(
         layout=Layout(root, focused_element=body),
         key_bindings=kb,
@@ -84,4 +363,29 @@ def select_host(connections, default, style):
         style=style,
     )
 
-    return app.run()
+    if profiling.ENABLED:
+        def first_render(app):
+            profiling.record("ui.first_render", started, time.perf_counter(), hosts=len(connections))
+            app.after_render -= first_render
+
+        app.after_render += first_render
+
+    if on_cursor:
+        under_cursor = object()
+
+        def cursor_moved(app):
+            nonlocal under_cursor
+            host = current()
+            if host is not under_cursor:
+                under_cursor = host
+                on_cursor(host)
+
+        app.after_render += cursor_moved
+
+    def start_tasks():
+        for task in tasks:
+            task(on_update)
+        for group in expanded:
+            load(group)
+
+    return app.run(pre_run=start_tasks)
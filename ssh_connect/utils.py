@@ -1,14 +1,40 @@
+import contextlib
 import os
 
-def save_last_pos(idx):
-    path = os.path.expanduser("~/.cache/ssh_last_connection")
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        f.write(str(idx))
+CACHE_DIR = "~/.cache"
+
+
+def cache_path(name):
+    return os.path.expanduser(os.path.join(CACHE_DIR, name))
+
+
+def atomic_write(path, data):
+    """Write `data` (str or bytes) to path via a temp file, so readers never see half a file."""
+    import tempfile
 
-def load_last_pos():
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # A unique name per writer: threads of one process may save the same file
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path`.lock, across threads and processes."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
     try:
-        path = os.path.expanduser("~/.cache/ssh_last_connection")
-        return int(open(path).read().strip())
-    except:
-        return 0
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
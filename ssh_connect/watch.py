@@ -0,0 +1,80 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import time
+
+# inotify event mask: anything that can change a file's contents or which
+# files exist (editors often write a new file and rename it over the old one)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Editors write in several steps; wait for them to settle
+SETTLE = 0.1
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = set()
+
+    def watch(self, dirs):
+        for d in set(dirs) - self.dirs:
+            if self._add(self.fd, os.fsencode(d), MASK) >= 0:
+                self.dirs.add(d)
+
+    def wait(self, timeout):
+        """True if anything happened in a watched directory within `timeout`."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        time.sleep(SETTLE)
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+
+def watch(state, dirs, on_change, interval=1.0):
+    """
+    Call on_change() on a daemon thread whenever state() returns something
+    new (e.g. the mtimes of some files).
+
+    Uses inotify on the directories from dirs() where available, so a change
+    is seen right away; state() is still checked every `interval` seconds,
+    which is all there is elsewhere.
+    """
+    try:
+        notify = _Inotify()
+    except (OSError, AttributeError):
+        notify = None  # no inotify (not Linux): poll
+
+    def run():
+        last = state()
+        while True:
+            if notify:
+                notify.watch(dirs())
+                notify.wait(interval)
+            else:
+                time.sleep(interval)
+            current = state()
+            if current != last:
+                last = current
+                on_change()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread